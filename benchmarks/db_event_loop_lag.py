@@ -0,0 +1,127 @@
+"""Event-loop lag under sustained database write load, blocking calls vs AsyncDatabase
+
+Writer tasks store verifications back to back while a probe task asks to
+wake up every --tick-ms and records how late it actually ran. Threads
+outside the event loop hold SQLite write transactions as well, the way the
+re-evaluation CLI or a second bot process would, so writers also wait for
+the write lock. The same load runs twice: once calling Database on the
+event loop, as the cogs used to, and once through AsyncDatabase.
+
+    python benchmarks/db_event_loop_lag.py --seconds 5 --max-lag-ms 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.database import AsyncDatabase, Database
+
+
+def hold_write_lock(database, hold_ms, stop):
+    """Repeatedly take SQLite's write lock for hold_ms, like a competing writer"""
+    while not stop.is_set():
+        with database._session(write=True) as session:
+            session.connection()
+            time.sleep(hold_ms / 1000)
+            session.commit()
+        time.sleep(hold_ms / 1000)
+
+
+async def probe(tick_ms, lags, stop):
+    """Record how much later than requested each tick wakes up"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(tick_ms / 1000)
+        lags.append((loop.time() - start) * 1000 - tick_ms)
+
+
+async def write_blocking(database, media, counter, stop):
+    while not stop.is_set():
+        database.add_verification('1', 'bench', media, 'photo', 21.0)
+        counter[0] += 1
+        # Without a yield the probe would never run at all
+        await asyncio.sleep(0)
+
+
+async def write_async(database, media, counter, stop):
+    while not stop.is_set():
+        await database.add_verification('1', 'bench', media, 'photo', 21.0)
+        counter[0] += 1
+
+
+async def run(mode, args, media):
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}", blob_root=os.path.join(directory, 'media')
+        )
+        stop, thread_stop = asyncio.Event(), threading.Event()
+        lags, counter = [], [0]
+        holders = [
+            threading.Thread(target=hold_write_lock, args=(database, args.hold_ms, thread_stop))
+            for _ in range(args.lock_holders)
+        ]
+        for holder in holders:
+            holder.start()
+
+        if mode == 'blocking':
+            writers = [write_blocking(database, media, counter, stop) for _ in range(args.writers)]
+        else:
+            async_database = AsyncDatabase(database, args.threads)
+            writers = [write_async(async_database, media, counter, stop) for _ in range(args.writers)]
+        tasks = [asyncio.create_task(coroutine) for coroutine in [probe(args.tick_ms, lags, stop), *writers]]
+
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+        thread_stop.set()
+        for holder in holders:
+            holder.join()
+        if mode == 'async':
+            async_database.close()
+        else:
+            database.engine.dispose()
+
+    lags = np.array(lags) if lags else np.zeros(1)
+    return {
+        'writes_per_second': counter[0] / args.seconds,
+        'p50_ms': float(np.percentile(lags, 50)),
+        'p99_ms': float(np.percentile(lags, 99)),
+        'max_ms': float(lags.max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--lock-holders', type=int, default=1)
+    parser.add_argument('--hold-ms', type=float, default=20.0)
+    parser.add_argument('--media-kb', type=int, default=512)
+    parser.add_argument('--tick-ms', type=float, default=5.0)
+    parser.add_argument('--max-lag-ms', type=float, default=None,
+                        help="fail if the AsyncDatabase run's p99 lag is above this")
+    args = parser.parse_args()
+
+    media = os.urandom(args.media_kb * 1024)
+    results = {mode: asyncio.run(run(mode, args, media)) for mode in ('blocking', 'async')}
+    for mode, result in results.items():
+        print(f"{mode:>8}: {result['writes_per_second']:.0f} writes/s, loop lag "
+              f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, max {result['max_ms']:.2f} ms")
+
+    if args.max_lag_ms is not None and results['async']['p99_ms'] > args.max_lag_ms:
+        print("FAIL: event-loop lag over budget")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
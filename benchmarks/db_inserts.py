@@ -0,0 +1,84 @@
+"""Insert throughput of small non-critical rows under each SQLite write profile
+
+Writes audit entries from several threads, the way the database threads of
+the bot do, and reports inserts per second for:
+
+    rollback  rollback journal, synchronous=FULL, one commit per row (the old setup)
+    wal       WAL with synchronous=NORMAL, one commit per row
+    batched   WAL with synchronous=NORMAL, through the write-behind buffer
+
+    python benchmarks/db_inserts.py --rows 2000 --directory /var/lib/bot
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.database import AuditEntry, Database
+
+PROFILES = {
+    'rollback': ({'journal_mode': 'DELETE', 'synchronous': 'FULL'}, False),
+    'wal': ({}, False),
+    'batched': ({}, True),
+}
+
+
+def insert_rows(database, rows, batched):
+    for i in range(rows):
+        database.add_audit_entry('benchmark', str(i), details='x' * 64)
+        if not batched:
+            # Commit every row on its own, as a direct insert would
+            database.write_behind.flush()
+
+
+def run(profile, args):
+    pragmas, batched = PROFILES[profile]
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        database = Database(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            blob_root=os.path.join(directory, 'media'),
+            pragmas=pragmas,
+            write_behind={'flush_ms': args.flush_ms, 'max_rows': args.max_rows}
+        )
+        per_thread = args.rows // args.threads
+        threads = [
+            threading.Thread(target=insert_rows, args=(database, per_thread, batched))
+            for _ in range(args.threads)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Rows only count once they are committed
+        database.write_behind.stop()
+        elapsed = time.perf_counter() - start
+
+        with database._session() as session:
+            stored = session.query(AuditEntry).count()
+        database.close()
+    return stored, stored / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--flush-ms', type=float, default=50)
+    parser.add_argument('--max-rows', type=int, default=200)
+    parser.add_argument('--directory', default=None,
+                        help="where to put the database; use the bot's disk, fsync cost depends on it")
+    args = parser.parse_args()
+
+    for profile in PROFILES:
+        stored, rate = run(profile, args)
+        print(f"{profile:>8}: {rate:8.0f} inserts/s ({stored} rows)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
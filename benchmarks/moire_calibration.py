@@ -0,0 +1,130 @@
+"""Score distributions of the moiré/halftone check on natural and halftone-replay faces
+
+Synthesises natural-looking face crops (1/f^beta spectra, sensor noise, JPEG)
+and re-photographed AM halftone prints (45 degree and random screen angles,
+4-8 px periods, lens blur, slight rotation, noise, JPEG), scores both the way
+MoireCheck.run does, and reports percentiles, the false-positive rate on the
+natural set and the detection rate on the halftone set at each threshold.
+Fails if the configured peak_ratio is above --max-fpr or below --min-detection.
+
+    python benchmarks/moire_calibration.py --samples 400 --peak-ratio 17
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.spoof_cascade import MoireCheck
+
+
+class CalibrationContext:
+    """The two products MoireCheck reads: the decoded image and one face box covering it"""
+
+    def __init__(self, image):
+        self.image = image
+        self.detections = [(0.0, 0.0, 1.0, 1.0, 0.9)]
+
+
+def natural_image(rng, side):
+    """Grayscale image with a 1/f^beta power spectrum, like natural scenes and skin"""
+    beta = rng.uniform(1.6, 2.6)
+    rows = np.fft.fftfreq(side)[:, None]
+    columns = np.fft.rfftfreq(side)[None, :]
+    radius = np.maximum(np.hypot(rows, columns), 1.0 / side)
+    spectrum = radius ** (-beta / 2) * np.exp(2j * np.pi * rng.random((side, side // 2 + 1)))
+    image = np.fft.irfft2(spectrum, s=(side, side))
+    image = (image - image.mean()) / (image.std() + 1e-9) * rng.uniform(15, 35) + rng.uniform(90, 160)
+
+    # Hard edges and shading of a face, hair and background on top of the texture
+    for _ in range(int(rng.integers(3, 10))):
+        center = tuple(int(c) for c in rng.integers(0, side, 2))
+        axes = tuple(int(a) for a in rng.integers(side // 16, side // 2, 2))
+        layer = np.zeros((side, side))
+        cv2.ellipse(layer, center, axes, float(rng.uniform(0, 180)), 0, 360, 1.0, -1)
+        image += cv2.GaussianBlur(layer, (0, 0), rng.uniform(0.5, 3)) * rng.uniform(-60, 60)
+    return image
+
+
+def halftone_print(rng, side):
+    """A natural image printed as an AM halftone screen and photographed again"""
+    # The print is rendered finer than the camera resolves and downsampled on capture
+    scale = rng.uniform(1.0, 1.6)
+    full = int(side * scale)
+    image = np.clip(natural_image(rng, full), 0, 255) / 255
+    period = rng.uniform(4.0, 8.0) * scale
+    side = full
+    angle = np.deg2rad(45.0 if rng.random() < 0.5 else rng.uniform(0, 90))
+    y, x = np.mgrid[0:side, 0:side].astype(np.float64)
+    u = (x * np.cos(angle) + y * np.sin(angle)) / period
+    v = (-x * np.sin(angle) + y * np.cos(angle)) / period
+    # Dot size grows with darkness: a pixel is ink when the screen function is under the tone
+    screen = (np.cos(2 * np.pi * u) + np.cos(2 * np.pi * v)) / 4 + 0.5
+    printed = np.where(screen < 1 - image, 0.1, 0.95) * 255
+
+    # The camera: lens blur, a slight tilt, reflectance and sensor noise
+    printed = cv2.GaussianBlur(printed, (0, 0), rng.uniform(0.8, 2.0) * scale)
+    matrix = cv2.getRotationMatrix2D((side / 2, side / 2), rng.uniform(-4, 4), rng.uniform(0.95, 1.05) / scale)
+    target = int(side / scale)
+    printed = cv2.warpAffine(printed, matrix, (side, side), borderMode=cv2.BORDER_REFLECT)
+    printed = cv2.resize(printed, (target, target), interpolation=cv2.INTER_AREA)
+    return printed * rng.uniform(0.7, 1.0) + rng.uniform(0, 30)
+
+
+def photograph(rng, image):
+    """Sensor noise and JPEG compression at a typical phone quality"""
+    image = image + rng.normal(0, rng.uniform(1, 4), image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(75, 95))])
+    return cv2.cvtColor(cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE), cv2.COLOR_GRAY2BGR)
+
+
+def scores(check, rng, make, samples):
+    values = []
+    for _ in range(samples):
+        side = int(rng.integers(256, 640))
+        context = CalibrationContext(photograph(rng, make(rng, side)))
+        patch = check._face_patch(context.image, context.detections[0])
+        values.append(check.score(patch))
+    return np.array(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--peak-ratio', type=float, default=MoireCheck().peak_ratio,
+                        help="threshold to check, the configured moire peak_ratio")
+    parser.add_argument('--max-fpr', type=float, default=0.01,
+                        help="largest share of natural faces the threshold may reject")
+    parser.add_argument('--min-detection', type=float, default=0.85,
+                        help="smallest share of halftone replays the threshold has to reject")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    check = MoireCheck()
+    natural = scores(check, rng, natural_image, args.samples)
+    halftone = scores(check, rng, halftone_print, args.samples)
+
+    for name, values in (('natural', natural), ('halftone', halftone)):
+        p1, p5, p50, p95, p99 = np.percentile(values, [1, 5, 50, 95, 99])
+        print(f"{name:>9}: p1 {p1:.1f}, p5 {p5:.1f}, median {p50:.1f}, p95 {p95:.1f}, p99 {p99:.1f}, "
+              f"max {values.max():.1f}")
+    for threshold in sorted({12, 14, 16, 17, 18, 20, 25, 30, args.peak_ratio}):
+        print(f"peak_ratio {threshold:5.1f}: false positives {np.mean(natural > threshold):6.1%}, "
+              f"halftone detected {np.mean(halftone > threshold):6.1%}")
+
+    fpr = np.mean(natural > args.peak_ratio)
+    detection = np.mean(halftone > args.peak_ratio)
+    if fpr > args.max_fpr or detection < args.min_detection:
+        print(f"FAIL: peak_ratio {args.peak_ratio} has {fpr:.1%} false positives "
+              f"and detects {detection:.1%} of halftone replays")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
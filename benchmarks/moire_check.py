@@ -0,0 +1,62 @@
+"""CPU budget benchmark for the moiré/halftone spoof check
+
+Times MoireCheck.run on a bounded-size decode with one detected face, the
+same input it gets inside the cascade, and fails if the 95th percentile is
+over budget.
+
+    python benchmarks/moire_check.py --budget-ms 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.spoof_cascade import MoireCheck
+
+
+class BenchmarkContext:
+    """The two products MoireCheck reads, precomputed so only the check is timed"""
+
+    def __init__(self, image, detections):
+        self.image = image
+        self.detections = detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--budget-ms', type=float, default=5.0)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=960)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    # A face covering a third of the frame, typical for a verification selfie
+    context = BenchmarkContext(image, [(0.33, 0.25, 0.33, 0.45, 0.9)])
+    check = MoireCheck()
+
+    for _ in range(20):
+        check.run(context)
+
+    timings = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        check.run(context)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    mean_ms = float(np.mean(timings))
+    p95_ms = float(np.percentile(timings, 95))
+    print(f"moire check: mean {mean_ms:.2f} ms, p95 {p95_ms:.2f} ms, budget {args.budget_ms:.2f} ms")
+    if p95_ms > args.budget_ms:
+        print("FAIL: over budget")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""Query-plan check for the hot database queries
+
+Builds the schema through create_all and the migrations, then asserts from
+EXPLAIN QUERY PLAN that every Database HOT_QUERIES entry searches an index
+instead of scanning a table. Point --url at a copy of a production database
+to check that its migrations ran:
+
+    python benchmarks/query_plans.py --url sqlite:///verification_data.db
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.database import HOT_QUERIES, Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=None, help="database to check instead of a fresh one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{os.path.join(directory, 'plans.db')}"
+        db = Database(url, blob_root=os.path.join(directory, 'media'))
+        with db._session() as session:
+            for name, build in HOT_QUERIES.items():
+                print(f"{name}: {'; '.join(db.query_plan(build(session)))}")
+        failures = db.check_query_plans()
+        db.engine.dispose()
+
+    if failures:
+        print(f"FAIL: {', '.join(failures)} not served by an index")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
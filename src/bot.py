@@ -3,10 +3,18 @@ from discord.ext import commands
 import json
 import logging
 import os
+import sys
 from datetime import datetime
 import aiohttp
 from discord import app_commands
 
+# Make the src package importable when run as a script
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.utils.database import AsyncDatabase, Database
+
 # Setup logging with more detailed format
 logging.basicConfig(
     level=logging.INFO,
@@ -37,12 +45,23 @@ class AgeVerificationBot(commands.Bot):
             description='Advanced Age Verification Bot'
         )
         
+        # One data-access layer (engine, pool and stats) shared by every cog as bot.db;
+        # its methods are coroutines that run on dedicated database threads
+        database_config = dict(config.get('database', {}))
+        database_threads = database_config.pop('threads', 4)
+        self.db = AsyncDatabase(Database(**database_config), database_threads)
+
         self.verification_sessions = {}
         self.startup_time = datetime.now()
         self.command_usage = {}
         
     async def setup_hook(self):
         """Set up bot and load all cogs"""
+        # Rows from before the blob store still carry their media inline
+        await self.db.move_media_to_blob_store()
+        # Logs a warning for any hot query that stopped using an index
+        await self.db.check_query_plans()
+
         try:
             # Load all cogs
             await self.load_extension('cogs.verification')
@@ -57,6 +76,11 @@ class AgeVerificationBot(commands.Bot):
             logger.error(f"Error loading cogs: {e}")
             raise
         
+    async def close(self):
+        """Log out, then let pending database calls finish and close the pool"""
+        await super().close()
+        self.db.close()
+
     async def on_ready(self):
         """Handle bot startup"""
         logger.info(f'Logged in as {self.user.name} (ID: {self.user.id})')
@@ -224,6 +248,49 @@ class AgeVerificationBot(commands.Bot):
             inline=False
         )
         
+        # Face detector load statistics reported by the inference workers
+        verification_cog = self.get_cog('Verification')
+        if verification_cog and verification_cog.inference.worker_stats:
+            workers = []
+            for pid, stats in verification_cog.inference.worker_stats.items():
+                memory = stats['graph_memory_bytes']
+                workers.append(
+                    f"Worker {pid}: load {stats['load_seconds']:.2f}s, "
+                    f"warm-up {stats['warm_up_seconds']:.2f}s"
+                    + (f", {memory / 2**20:.0f} MiB" if memory is not None else "")
+                )
+            embed.add_field(
+                name="Face Detection",
+                value="\n".join(workers),
+                inline=False
+            )
+
+        # Database pool and SQLite lock statistics
+        db_stats = await self.db.pool_stats()
+        embed.add_field(
+            name="Database",
+            value=f"{db_stats['pool']}\n"
+                  f"Units of work: {db_stats['reads']} reads, {db_stats['writes']} writes, "
+                  f"{db_stats['pending_calls']} in flight on {db_stats['threads']} threads\n"
+                  f"Checkout wait: {db_stats['mean_checkout_ms']:.1f}ms mean, {db_stats['max_checkout_ms']:.1f}ms max\n"
+                  f"Write lock wait: {db_stats['mean_lock_wait_ms']:.1f}ms mean, "
+                  f"{db_stats['max_lock_wait_ms']:.1f}ms max, {db_stats['lock_timeouts']} timeouts\n"
+                  f"Write-behind: {db_stats['write_behind_pending']} pending, "
+                  f"{db_stats['write_behind_flushed']} written, {db_stats['write_behind_dropped']} dropped",
+            inline=False
+        )
+
+        # Verification job queue depth
+        if verification_cog:
+            depth = await self.db.queue_depth()
+            embed.add_field(
+                name="Verification Queue",
+                value=f"Queued: {depth.get('queued', 0)}\n"
+                      f"Running: {depth.get('running', 0)}\n"
+                      f"Failed: {depth.get('failed', 0)}",
+                inline=False
+            )
+
         # Cog Status
         cogs = []
         for cog in self.cogs:
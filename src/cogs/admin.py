@@ -1,13 +1,19 @@
 import discord
 from discord.ext import commands
+import asyncio
+import json
 import logging
+import time
 from discord import app_commands
-import io
 from datetime import datetime
-from ..utils.database import Database
+import numpy as np
+from ..utils.detector_registry import get_detector
 
 logger = logging.getLogger('age-verify-bot')
 
+# Review queue entries shown per /pending_reviews page
+REVIEW_PAGE_SIZE = 10
+
 # Load configuration
 with open('config/config.json', 'r') as f:
     config = json.load(f)
@@ -15,46 +21,98 @@ with open('config/config.json', 'r') as f:
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
 
     @app_commands.command(name="pending_reviews")
     @app_commands.checks.has_permissions(administrator=True)
-    async def pending_reviews(self, interaction: discord.Interaction):
-        """Show pending verification reviews"""
-        # Get all members with awaiting_review role
-        awaiting_role = discord.utils.get(
-            interaction.guild.roles,
-            name=config['roles']['awaiting_review']
-        )
-        
-        if not awaiting_role or not awaiting_role.members:
+    @app_commands.describe(sort="Order of the review queue")
+    @app_commands.choices(sort=[
+        app_commands.Choice(name="Oldest first", value="oldest"),
+        app_commands.Choice(name="Newest first", value="newest"),
+        app_commands.Choice(name="Lowest video liveness first", value="liveness"),
+        app_commands.Choice(name="Youngest estimate first", value="age"),
+    ])
+    async def pending_reviews(
+        self,
+        interaction: discord.Interaction,
+        sort: app_commands.Choice[str] = None
+    ):
+        """Show pending verification reviews, a page at a time"""
+        order = sort.value if sort else 'oldest'
+        guild_id = str(interaction.guild.id)
+        # The queue is counted once here; page turns only run the keyset query
+        page = await self.db.get_review_page(guild_id, order, limit=REVIEW_PAGE_SIZE, count_pending=True)
+        pending_count = page.pending_count
+        if not page.rows:
             await interaction.response.send_message(
                 "No pending verifications to review.",
                 ephemeral=True
             )
             return
 
-        embed = discord.Embed(
-            title="Pending Age Verification Reviews",
-            color=discord.Color.blue(),
-            description=f"Total pending reviews: {len(awaiting_role.members)}"
-        )
+        cog = self
 
-        for member in awaiting_role.members[:10]:  # Show first 10 pending reviews
-            verification = self.db.get_latest_verification(str(member.id))
-            if verification:
-                embed.add_field(
-                    name=f"User: {member.name}#{member.discriminator}",
-                    value=f"ID: {member.id}\n"
-                          f"Estimated Age: {verification.estimated_age:.1f}\n"
-                          f"Joined: {member.joined_at.strftime('%Y-%m-%d %H:%M:%S')}",
-                    inline=False
+        class ReviewQueueButtons(discord.ui.View):
+            def __init__(self):
+                super().__init__(timeout=300)  # 5 minute timeout
+                self.page = page
+                self.number = 1
+                self.update_buttons()
+
+            def update_buttons(self):
+                self.previous_page.disabled = not self.page.has_previous
+                self.next_page.disabled = not self.page.has_next
+
+            async def show(self, button_interaction, cursor, backwards):
+                page = await cog.db.get_review_page(guild_id, order, cursor, backwards, limit=REVIEW_PAGE_SIZE)
+                if page.rows:
+                    self.page = page
+                    self.number += -1 if backwards else 1
+                self.update_buttons()
+                await button_interaction.response.edit_message(
+                    embed=cog.review_page_embed(interaction.guild, self.page, self.number, pending_count),
+                    view=self
                 )
 
-        if len(awaiting_role.members) > 10:
-            embed.set_footer(text=f"And {len(awaiting_role.members) - 10} more...")
+            @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey)
+            async def previous_page(self, button_interaction: discord.Interaction, button: discord.ui.Button):
+                await self.show(button_interaction, self.page.first_cursor, True)
 
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+            @discord.ui.button(label="Next", style=discord.ButtonStyle.grey)
+            async def next_page(self, button_interaction: discord.Interaction, button: discord.ui.Button):
+                await self.show(button_interaction, self.page.last_cursor, False)
+
+        await interaction.response.send_message(
+            embed=self.review_page_embed(interaction.guild, page, 1, pending_count),
+            view=ReviewQueueButtons(),
+            ephemeral=True
+        )
+
+    def review_page_embed(self, guild, page, number, pending_count):
+        """Embed listing one page of the review queue; pending_count is the queue size when it was opened"""
+        embed = discord.Embed(
+            title="Pending Age Verification Reviews",
+            color=discord.Color.blue(),
+            description=f"Total pending reviews: {pending_count}"
+        )
+        for verification in page.rows:
+            member = guild.get_member(int(verification.user_id))
+            name = f"{member.name}#{member.discriminator}" if member else f"{verification.username} (left the server)"
+            age = f"{verification.estimated_age:.1f}" if verification.estimated_age is not None else "unknown"
+            liveness = (
+                f"\nLiveness: {verification.liveness_score:.2f}"
+                if verification.liveness_score is not None else ""
+            )
+            embed.add_field(
+                name=f"User: {name}",
+                value=f"ID: {verification.user_id}\n"
+                      f"Estimated Age: {age}"
+                      f"{liveness}\n"
+                      f"Submitted: {verification.submission_date.strftime('%Y-%m-%d %H:%M:%S')}",
+                inline=False
+            )
+        embed.set_footer(text=f"Page {number}")
+        return embed
 
     @app_commands.command(name="view_verification")
     @app_commands.checks.has_permissions(administrator=True)
@@ -64,7 +122,7 @@ class Admin(commands.Cog):
         user: discord.Member
     ):
         """View a user's verification submission"""
-        verification = self.db.get_latest_verification(str(user.id))
+        verification = await self.db.get_latest_verification(str(user.id))
         
         if not verification:
             await interaction.response.send_message(
@@ -73,9 +131,9 @@ class Admin(commands.Cog):
             )
             return
 
-        # Create file object from stored media
+        # Streamed from the blob store; discord.File closes it after the upload
         file = discord.File(
-            io.BytesIO(verification.media_data),
+            await self.db.open_media(verification),
             filename=f"verification_{verification.id}.{verification.media_type}"
         )
 
@@ -85,6 +143,8 @@ class Admin(commands.Cog):
         )
         embed.add_field(name="User ID", value=user.id, inline=True)
         embed.add_field(name="Estimated Age", value=f"{verification.estimated_age:.1f}", inline=True)
+        if verification.liveness_score is not None:
+            embed.add_field(name="Liveness", value=f"{verification.liveness_score:.2f}", inline=True)
         embed.add_field(
             name="Submitted",
             value=verification.submission_date.strftime('%Y-%m-%d %H:%M:%S'),
@@ -153,5 +213,60 @@ class Admin(commands.Cog):
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    def rescore_ages(self, apply=False, chunk_size=1000):
+        """Re-estimate every stored age from its landmarks with the current age rules
+
+        Landmarks are read chunk_size rows at a time in id order, and with
+        apply each chunk's new estimates are saved before the next is read.
+        Returns a summary dict.
+        """
+        start = time.perf_counter()
+        # Only the age rules are needed, the MediaPipe graphs are never loaded here
+        detector = get_detector(**config.get('face_detection', {}))
+        min_age = config['verification_settings']['min_age']
+        summary = {'rows': 0, 'changed': 0, 'newly_underage': 0, 'no_longer_underage': 0}
+
+        # Runs in an executor thread, so it calls the synchronous Database directly
+        for rows in self.db.sync.iter_landmark_chunks(chunk_size=chunk_size):
+            ages = detector.rescore_landmarks([row.landmarks for row in rows])
+            old_ages = np.array([np.nan if row.estimated_age is None else row.estimated_age for row in rows])
+
+            scored = ~np.isnan(ages)
+            changed = scored & ~np.isclose(ages, old_ages)
+            summary['rows'] += len(rows)
+            summary['changed'] += int(changed.sum())
+            summary['newly_underage'] += int((changed & (ages < min_age) & ~(old_ages < min_age)).sum())
+            summary['no_longer_underage'] += int((changed & ~(ages < min_age) & (old_ages < min_age)).sum())
+
+            if apply and changed.any():
+                self.db.sync.update_estimated_ages({
+                    row.id: float(age) for row, age, is_changed in zip(rows, ages, changed) if is_changed
+                })
+        summary['score_seconds'] = time.perf_counter() - start
+        logger.info(f"Re-scored {summary['rows']} stored ages, {summary['changed']} changed (applied: {apply})")
+        return summary
+
+    @app_commands.command(name="rescore_ages")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(apply="Save the new estimates instead of only reporting the differences")
+    async def rescore_ages_command(self, interaction: discord.Interaction, apply: bool = False):
+        """Re-run the current age estimator on stored landmarks"""
+        await interaction.response.defer(ephemeral=True)
+        loop = asyncio.get_running_loop()
+        summary = await loop.run_in_executor(None, self.rescore_ages, apply)
+
+        embed = discord.Embed(
+            title="Age Re-score" + (" (applied)" if apply else " (dry run)"),
+            color=discord.Color.blue(),
+            timestamp=datetime.now()
+        )
+        embed.add_field(name="Submissions", value=str(summary['rows']), inline=True)
+        embed.add_field(name="Changed", value=str(summary['changed']), inline=True)
+        embed.add_field(name="Time", value=f"{summary['score_seconds']:.2f}s", inline=True)
+        embed.add_field(name="Newly Under Minimum Age", value=str(summary['newly_underage']), inline=True)
+        embed.add_field(name="No Longer Under Minimum Age", value=str(summary['no_longer_underage']), inline=True)
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(Admin(bot))
@@ -10,7 +10,6 @@ import os
 # Add the project root directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from src.utils.database import Database
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -21,7 +20,7 @@ with open('config/config.json', 'r') as f:
 class AdminControl(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.verification_states = {
             "13": True,
             "18": True
@@ -9,7 +9,6 @@ import matplotlib.pyplot as plt
 import io
 import numpy as np
 from collections import defaultdict
-from ..utils.database import Database
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -20,7 +19,7 @@ with open('config/config.json', 'r') as f:
 class AdvancedFeatures(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.verification_queue = []
         self.staff_workload = defaultdict(int)
         self.staff_performance = defaultdict(lambda: {'total': 0, 'accurate': 0})
@@ -42,7 +41,7 @@ class AdvancedFeatures(commands.Cog):
         while True:
             try:
                 if self.verification_queue:
-                    avg_wait_time = self.calculate_average_wait_time()
+                    avg_wait_time = await self.calculate_average_wait_time()
                     for position, user_id in enumerate(self.verification_queue, 1):
                         user = self.bot.get_user(int(user_id))
                         if user:
@@ -56,9 +55,9 @@ class AdvancedFeatures(commands.Cog):
                 logger.error(f"Error updating queue status: {e}")
             await asyncio.sleep(300)  # Update every 5 minutes
 
-    def calculate_average_wait_time(self):
+    async def calculate_average_wait_time(self):
         """Calculate average verification wait time"""
-        recent_verifications = self.db.get_recent_verifications(hours=24)
+        recent_verifications = await self.db.get_recent_verifications(hours=24)
         if not recent_verifications:
             return 15  # Default estimate
         
@@ -75,7 +74,7 @@ class AdvancedFeatures(commands.Cog):
         )
         
         queue_length = len(self.verification_queue)
-        avg_wait = self.calculate_average_wait_time()
+        avg_wait = await self.calculate_average_wait_time()
         
         embed.add_field(
             name="Queue Length",
@@ -160,19 +159,22 @@ class AdvancedFeatures(commands.Cog):
     @app_commands.checks.has_permissions(administrator=True)
     async def show_analytics(self, interaction: discord.Interaction):
         """Show advanced analytics"""
+        guild_id = str(interaction.guild.id)
+
         # Create analytics graphs
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 12))
         
         # Verification trends
-        dates, counts = zip(*self.db.get_verification_trends())
+        dates, counts = zip(*await self.db.get_verification_trends(guild_id))
         ax1.plot(dates, counts)
         ax1.set_title("Verification Trends")
         ax1.set_xlabel("Date")
         ax1.set_ylabel("Verifications")
         
         # Age distribution
-        ages, age_counts = zip(*self.db.get_age_distribution())
-        ax2.bar(ages, age_counts)
+        bin_years = 2
+        ages, age_counts = zip(*await self.db.get_age_distribution(bin_years, guild_id))
+        ax2.bar(ages, age_counts, width=bin_years, align='edge')
         ax2.set_title("Age Distribution")
         ax2.set_xlabel("Age")
         ax2.set_ylabel("Count")
@@ -195,7 +197,7 @@ class AdvancedFeatures(commands.Cog):
         embed.set_image(url="attachment://analytics.png")
         
         # Add statistics
-        stats = self.db.get_advanced_stats()
+        stats = await self.db.get_advanced_stats(guild_id)
         embed.add_field(
             name="Peak Hours",
             value=stats['peak_hours'],
@@ -222,12 +224,17 @@ class AdvancedFeatures(commands.Cog):
         """Analyze and update staff performance metrics"""
         while True:
             try:
-                for staff_id in self.staff_performance:
-                    recent_reviews = self.db.get_staff_reviews(staff_id, hours=24)
-                    accurate = sum(1 for r in recent_reviews if r.accurate)
+                # One grouped query for every reviewer of the last 24 hours
+                reviews = await self.db.get_staff_review_stats(
+                    since=datetime.utcnow() - timedelta(hours=24),
+                    min_age=config['verification_settings']['min_age']
+                )
+                for staff_id in set(self.staff_performance) | set(reviews):
+                    # Decisions that agree with the age estimate stand in for accuracy
+                    stats = reviews.get(staff_id, {'total': 0, 'agreed': 0})
                     self.staff_performance[staff_id].update({
-                        'total': len(recent_reviews),
-                        'accurate': accurate
+                        'total': stats['total'],
+                        'accurate': stats['agreed']
                     })
             except Exception as e:
                 logger.error(f"Error analyzing staff performance: {e}")
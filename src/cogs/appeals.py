@@ -5,7 +5,6 @@ import logging
 from discord import app_commands
 from datetime import datetime, timedelta
 import asyncio
-from ..utils.database import Database
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -16,7 +15,7 @@ with open('config/config.json', 'r') as f:
 class Appeals(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.appeal_cooldowns = {}
 
     @app_commands.command(name="appeal")
@@ -34,6 +33,9 @@ class Appeals(commands.Cog):
                 )
                 return
 
+        # Inside the modal, self is the modal rather than the cog
+        db = self.db
+
         # Create appeal form
         class AppealModal(discord.ui.Modal, title='Age Verification Appeal'):
             reason = discord.ui.TextInput(
@@ -92,7 +94,7 @@ class Appeals(commands.Cog):
                     )
 
                     # Store appeal in database
-                    self.db.add_appeal(
+                    await db.add_appeal(
                         user_id=str(modal_interaction.user.id),
                         appeal_msg_id=str(appeal_msg.id),
                         reason=self.reason.value,
@@ -201,7 +203,7 @@ class Appeals(commands.Cog):
     @app_commands.checks.has_permissions(administrator=True)
     async def appeal_stats(self, interaction: discord.Interaction):
         """View appeal statistics"""
-        stats = self.db.get_appeal_stats()
+        stats = await self.db.get_appeal_stats()
         
         embed = discord.Embed(
             title="Appeal Statistics",
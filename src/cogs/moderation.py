@@ -5,7 +5,6 @@ import logging
 from discord import app_commands
 from datetime import datetime, timedelta
 import asyncio
-from ..utils.database import Database
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -16,7 +15,7 @@ with open('config/config.json', 'r') as f:
 class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.lockdown = config['moderation']['lockdown_mode']
         self.raid_protection_triggered = False
         self.join_times = []
@@ -5,7 +5,6 @@ import logging
 from discord import app_commands
 from datetime import datetime, timedelta
 import io
-from ..utils.database import Database
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -16,7 +15,7 @@ with open('config/config.json', 'r') as f:
 class Privacy(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.deletion_requests = {}
 
     @app_commands.command(name="privacy")
@@ -61,6 +60,9 @@ class Privacy(commands.Cog):
                 )
                 return
 
+        # Inside the view, self is the view rather than the cog
+        db = self.db
+
         # Create confirmation view
         class ConfirmDeletion(discord.ui.View):
             def __init__(self):
@@ -70,7 +72,7 @@ class Privacy(commands.Cog):
             async def confirm(self, button_interaction: discord.Interaction, button: discord.ui.Button):
                 try:
                     # Delete verification data
-                    deleted = self.db.delete_user_data(user_id)
+                    deleted = await db.delete_user_data(user_id)
                     
                     if deleted:
                         # Log deletion
@@ -131,7 +133,7 @@ class Privacy(commands.Cog):
     async def show_data_info(self, interaction: discord.Interaction):
         """Show what data is stored about you"""
         user_id = str(interaction.user.id)
-        user_data = self.db.get_user_data(user_id)
+        user_data = await self.db.get_user_data(user_id)
 
         if not user_data:
             await interaction.response.send_message(
@@ -178,7 +180,7 @@ class Privacy(commands.Cog):
     async def check_consent_status(self, interaction: discord.Interaction):
         """Check your current consent status"""
         user_id = str(interaction.user.id)
-        consent_status = self.db.get_consent_status(user_id)
+        consent_status = await self.db.get_consent_status(user_id)
 
         embed = discord.Embed(
             title="Consent Status",
@@ -7,7 +7,6 @@ from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 import io
 import numpy as np
-from ..utils.database import Database
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -18,7 +17,7 @@ with open('config/config.json', 'r') as f:
 class Statistics(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
 
     def create_graph(self, data, title, xlabel, ylabel):
         """Create a graph from the provided data"""
@@ -56,16 +55,14 @@ class Statistics(commands.Cog):
         total_members = guild.member_count
         verified_percent = (verified_count / total_members * 100) if total_members > 0 else 0
         
-        # Get verification trends for the last 7 days
-        now = datetime.now()
-        daily_stats = []
-        for i in range(7):
-            date = now - timedelta(days=i)
-            verifications = self.db.get_verifications_for_date(date)
-            daily_stats.append((date, len(verifications)))
+        # Get verification trends for the last 7 days from the daily rollup
+        guild_id = str(guild.id)
+        today = datetime.utcnow().date()
+        daily_stats = await self.db.get_daily_stats(guild_id, today - timedelta(days=6), today)
         
         # Create verification trend graph
-        dates, counts = zip(*daily_stats)
+        dates = [day['day'] for day in daily_stats]
+        counts = [day['submissions'] for day in daily_stats]
         graph_buf = self.create_graph(
             (dates, counts),
             "Verification Trend - Last 7 Days",
@@ -91,7 +88,7 @@ class Statistics(commands.Cog):
         )
         
         # Today's Stats
-        today_stats = self.db.get_todays_stats()
+        today_stats = await self.db.get_todays_stats(guild_id)
         embed.add_field(
             name="Today's Activity",
             value=f"Submissions: {today_stats['submissions']}\n"
@@ -102,7 +99,7 @@ class Statistics(commands.Cog):
         )
         
         # Average Processing Time
-        avg_time = self.db.get_average_processing_time()
+        avg_time = await self.db.get_average_processing_time(guild_id)
         embed.add_field(
             name="Processing Time",
             value=f"Average: {avg_time:.1f} minutes",
@@ -123,8 +120,9 @@ class Statistics(commands.Cog):
     @app_commands.checks.has_permissions(administrator=True)
     async def age_distribution(self, interaction: discord.Interaction):
         """Show age distribution of verified members"""
-        # Get age data from database
-        age_data = self.db.get_age_distribution()
+        # Get the age histogram from database
+        bin_years = 2
+        age_data = await self.db.get_age_distribution(bin_years, str(interaction.guild.id))
         
         if not age_data:
             await interaction.response.send_message(
@@ -136,7 +134,7 @@ class Statistics(commands.Cog):
         # Create age distribution graph
         plt.figure(figsize=(10, 6))
         ages, counts = zip(*age_data)
-        plt.bar(ages, counts)
+        plt.bar(ages, counts, width=bin_years, align='edge')
         plt.title("Age Distribution of Verified Members")
         plt.xlabel("Estimated Age")
         plt.ylabel("Number of Members")
@@ -154,16 +152,17 @@ class Statistics(commands.Cog):
             timestamp=datetime.now()
         )
         
-        # Calculate statistics
-        all_ages = [age for age, count in age_data for _ in range(count)]
-        avg_age = np.mean(all_ages)
-        median_age = np.median(all_ages)
+        # Calculate statistics from the histogram, placing members in the middle of their bin
+        centers = np.array(ages) + bin_years / 2
+        counts = np.array(counts)
+        avg_age = np.average(centers, weights=counts)
+        median_age = centers[np.searchsorted(np.cumsum(counts), counts.sum() / 2)]
         
         embed.add_field(
             name="Statistics",
             value=f"Average Age: {avg_age:.1f}\n"
                   f"Median Age: {median_age:.1f}\n"
-                  f"Total Samples: {len(all_ages)}",
+                  f"Total Samples: {counts.sum()}",
             inline=False
         )
         
@@ -182,7 +181,10 @@ class Statistics(commands.Cog):
     async def staff_stats(self, interaction: discord.Interaction):
         """Show staff review statistics"""
         # Get staff review data
-        staff_data = self.db.get_staff_review_stats()
+        staff_data = await self.db.get_staff_review_stats(
+            min_age=config['verification_settings']['min_age'],
+            guild_id=str(interaction.guild.id)
+        )
         
         if not staff_data:
             await interaction.response.send_message(
@@ -205,17 +207,61 @@ class Statistics(commands.Cog):
                     value=f"Reviews: {stats['total']}\n"
                           f"Approvals: {stats['approvals']}\n"
                           f"Rejections: {stats['rejections']}\n"
-                          f"Avg Time: {stats['avg_time']:.1f} min",
+                          f"Approval Rate: {stats['approval_rate']:.1f}%\n"
+                          f"Avg Time: {stats['avg_time']:.1f} min\n"
+                          f"Median / P90: {stats['p50_time']:.1f} / {stats['p90_time']:.1f} min",
                     inline=True
                 )
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @app_commands.command(name="spoof_stats")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def spoof_stats(self, interaction: discord.Interaction):
+        """Show what the spoof and quality checks reject, and what they and each analysis stage cost"""
+        verification_cog = self.bot.get_cog('Verification')
+        checks = verification_cog.cascade_stats.checks if verification_cog else {}
+        stages = verification_cog.stage_stats.stages if verification_cog else {}
+
+        if not checks and not stages:
+            await interaction.response.send_message(
+                "No spoof check data available yet.",
+                ephemeral=True
+            )
+            return
+
+        embed = discord.Embed(
+            title="Spoof Check Statistics",
+            color=discord.Color.blue(),
+            timestamp=datetime.now()
+        )
+
+        # Cheapest checks first, matching the order the cascade runs them in
+        for name, stats in sorted(checks.items(), key=lambda item: item[1].mean_ms):
+            reasons = sorted(stats.reasons.items(), key=lambda item: -item[1])[:3]
+            value = (f"Runs: {stats.runs}\n"
+                     f"Passed: {stats.passed}\n"
+                     f"Rejected: {stats.rejected}\n"
+                     f"Avg Time: {stats.mean_ms:.1f} ms")
+            if reasons:
+                value += "\n" + "\n".join(f"• {reason}: {count}" for reason, count in reasons)
+            embed.add_field(name=name, value=value, inline=True)
+
+        # Where the time of an analysis goes, slowest stages first
+        for media_type, latencies in sorted(stages.items()):
+            value = "\n".join(
+                f"{name}: {stats.mean_ms:.1f} ms avg, {stats.max_ms:.1f} max ({stats.runs} runs)"
+                for name, stats in sorted(latencies.items(), key=lambda item: -item[1].mean_ms)
+            )
+            embed.add_field(name=f"{media_type.title()} stage latency", value=value, inline=False)
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="export_stats")
     @app_commands.checks.has_permissions(administrator=True)
     async def export_stats(self, interaction: discord.Interaction):
         """Export verification statistics to CSV"""
-        stats_data = self.db.export_verification_stats()
+        stats_data = await self.db.export_verification_stats(str(interaction.guild.id))
         
         # Create CSV in memory
         buf = io.StringIO()
@@ -1,3 +1,4 @@
+import aiohttp
 import discord
 from discord.ext import commands
 import json
@@ -7,6 +8,7 @@ from datetime import datetime, timedelta
 import io
 import os
 import sys
+import time
 
 # Get the project root directory
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,8 +17,12 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-from src.utils.database import Database
-from src.utils.face_detection import FaceDetector
+from src.utils.inference import InferenceExecutor, TransientAnalysisError
+from src.utils.media_cache import MediaCache
+from src.utils.media_probe import ProbeError, check_limits, probe_remote
+from src.utils.face_detection import StageStats
+from src.utils.face_index import FaceIndex, encode_descriptor, decode_descriptor
+from src.utils.spoof_cascade import CascadeStats
 
 logger = logging.getLogger('age-verify-bot')
 
@@ -32,49 +38,509 @@ class Verification(commands.Cog):
         """Initialize the verification cog"""
         self.bot = bot
         self.verification_cooldowns = {}
-        self.db = Database()
-        self.face_detector = FaceDetector()
+        self.db = bot.db
         self.disabled_verifications = set()
 
-    async def process_media(self, attachment, user_id, username):
-        """Process image or video for age verification"""
+        # MediaPipe/OpenCV work runs in worker processes, never on the event loop
+        inference_config = config.get('inference', {})
+        self.inference = InferenceExecutor(
+            max_workers=inference_config.get('workers', 2),
+            timeout=inference_config.get('job_timeout_seconds', 30),
+            max_retries=inference_config.get('max_retries', 1),
+            detector_options=config.get('face_detection', {})
+        )
+
+        # Size, resolution and length budgets, checked from headers before any full download
+        self.media_limits = config.get('media_limits', {})
+        self.http_session = None
+
+        # Results for media that was already analysed, e.g. resends and alt accounts
+        cache_config = config.get('media_cache', {})
+        self.media_cache = MediaCache(
+            max_entries=cache_config.get('max_entries', 1024),
+            ttl_seconds=cache_config.get('ttl_hours', 24) * 3600,
+            max_hash_distance=cache_config.get('max_hash_distance', 4),
+            # Same decode budget as the inference workers, since the hash decodes in the bot process
+            max_decode_pixels=config['face_detection'].get('max_decode_pixels', 40_000_000)
+        )
+
+        # Pass/fail counts and latency of each spoof check, aggregated across workers
+        self.cascade_stats = CascadeStats()
+        # Latency of each analysis stage (decode, detect, mesh, ...) per media type
+        self.stage_stats = StageStats()
+
+        # Faces of earlier submissions, to catch ban evasion with a new account
+        self.face_index = FaceIndex(
+            max_distance=config.get('face_index', {}).get('max_distance', 0.03)
+        )
+
+        # Submissions wait in the durable job queue table; a fixed number of
+        # worker tasks process them, so bursts queue up instead of piling up coroutines
+        self.queue_settings = config.get('job_queue', {})
+        self.queue_event = asyncio.Event()
+        self.queue_workers = []
+
+        # Expired verifications, media, jobs and audit entries are purged in small batches
+        self.retention_settings = config.get('retention', {})
+        self.retention_task = None
+
+    async def cog_load(self):
+        """Start and warm the inference workers, load the face index and start the queue and retention workers"""
+        self.warm_up_task = asyncio.create_task(self.inference.start())
+        loop = asyncio.get_running_loop()
+        self.face_index_task = loop.run_in_executor(None, self.rebuild_face_index)
+        self.queue_workers = [
+            asyncio.create_task(self.run_queue_worker())
+            for _ in range(self.queue_settings.get('workers', 2))
+        ]
+        self.retention_task = asyncio.create_task(self.run_retention_worker())
+
+    def rebuild_face_index(self):
+        """Load every stored face descriptor into the face index; runs in an executor thread"""
         try:
-            # Download the media content
-            media_data = await attachment.read()
-            media_type = 'video' if attachment.filename.lower().endswith(('.mp4', '.mov')) else 'photo'
-            
-            # Check for spoofing if it's a photo
-            if media_type == 'photo':
-                is_spoof, spoof_error = self.face_detector.is_spoof(media_data)
-                if is_spoof:
-                    return None, f"Verification failed: {spoof_error}"
-
-            # Process media for age estimation
-            if media_type == 'photo':
-                estimated_age, error = self.face_detector.process_image(media_data)
+            self.face_index.rebuild(self.db.sync.get_face_descriptors())
+        except Exception as e:
+            logger.error(f"Error rebuilding face index: {e}")
+
+    def check_face(self, descriptor, user_id):
+        """Review flags for stored faces from other accounts that match this one"""
+        flags = []
+        for match in self.face_index.search(descriptor, exclude_user=str(user_id)):
+            if match.banned:
+                flags.append(f"Face matches banned user {match.user_id} (distance {match.distance:.3f})")
+            else:
+                flags.append(f"Face matches user {match.user_id} (distance {match.distance:.3f})")
+        return flags
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild, user):
+        """Remember banned faces so new accounts with the same face are flagged"""
+        # Stored so rebuild_face_index still knows the ban after a restart
+        await self.db.add_ban(str(user.id), str(guild.id))
+        self.face_index.set_banned(str(user.id))
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild, user):
+        """Stop flagging a user's face once no guild bans them any more"""
+        if not await self.db.remove_ban(str(user.id), str(guild.id)):
+            self.face_index.set_banned(str(user.id), False)
+
+    async def review_user(self, interaction, member, is_underage):
+        """Record a staff decision on a member's latest submission and apply it
+
+        The decision goes through update_review, which counts it in the daily
+        stats. Members judged underage are banned; the others lose the
+        awaiting review and unverified roles and get the age role of their estimate.
+        """
+        verification = await self.db.get_latest_verification(str(member.id))
+        if not verification:
+            await interaction.response.send_message(
+                "No verification submission found for this user.",
+                ephemeral=True
+            )
+            return
+
+        await self.db.update_review(verification.id, str(interaction.user.id), not is_underage)
+        try:
+            if is_underage:
+                await member.ban(reason=f"Underage, verification reviewed by {interaction.user}")
+                result = f"🔨 {member} was banned as underage."
             else:
-                estimated_age, error = self.face_detector.process_video(media_data)
+                settings = config['verification_settings']
+                age_role = 'verified_18plus' if (verification.estimated_age or 0) >= settings['adult_age'] else 'verified_13plus'
+                roles = member.guild.roles
+                removed = [
+                    role for role in (
+                        discord.utils.get(roles, name=config['roles']['awaiting_review']),
+                        discord.utils.get(roles, name=config['roles']['unverified'])
+                    ) if role in member.roles
+                ]
+                if removed:
+                    await member.remove_roles(*removed)
+                added = discord.utils.get(roles, name=config['roles'][age_role])
+                if added:
+                    await member.add_roles(added)
+                result = f"✅ {member} was verified."
+        except discord.Forbidden:
+            logger.error(f"Missing permissions to apply review of {member.id} in {member.guild.name}")
+            result = f"⚠️ Review of {member} recorded, but I lack the permissions to apply it."
+
+        await interaction.response.send_message(result, ephemeral=True)
+
+    async def cog_unload(self):
+        """Stop the queue and inference workers; unfinished jobs are picked up again after a restart"""
+        self.warm_up_task.cancel()
+        for worker in self.queue_workers:
+            worker.cancel()
+        if self.retention_task is not None:
+            self.retention_task.cancel()
+        self.inference.shutdown()
+        if self.http_session is not None:
+            await self.http_session.close()
+
+    async def read_range(self, url, start, end):
+        """Fetch bytes [start, end) of a remote file with an HTTP range request"""
+        if self.http_session is None:
+            self.http_session = aiohttp.ClientSession()
+        headers = {'Range': f"bytes={start}-{end - 1}"}
+        async with self.http_session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            if response.status != 206 and start > 0:
+                raise ProbeError("Server does not support range requests")
+            # read() returns only what is buffered, so wait for the whole range; never
+            # read more than asked for, even if the range was ignored
+            try:
+                return await response.content.readexactly(end - start)
+            except asyncio.IncompleteReadError as e:
+                raise ProbeError(f"File ended after {len(e.partial)} of {end - start} bytes")
+
+    async def check_media_limits(self, attachment):
+        """Probe an attachment's header; returns a rejection message if it is over budget, else None"""
+        limits = self.media_limits
+        max_bytes = limits.get('max_bytes')
+        if max_bytes and attachment.size > max_bytes:
+            return f"File is too large, please send media under {max_bytes // (1024 * 1024)} MB."
+
+        # Discord already reports image dimensions, so most oversized images stop here
+        max_pixels = limits.get('max_pixels')
+        if max_pixels and attachment.width and attachment.height \
+                and attachment.width * attachment.height > max_pixels:
+            return "Image resolution is too large, please send a smaller image."
+
+        try:
+            info = await probe_remote(
+                lambda start, end: self.read_range(attachment.url, start, end),
+                attachment.size,
+                header_bytes=limits.get('header_bytes', 65536),
+                max_metadata_bytes=limits.get('max_metadata_bytes', 4 * 1024 * 1024)
+            )
+        except ProbeError as e:
+            logger.warning(f"Rejected unreadable media header {attachment.filename}: {e}")
+            return "Could not read this file, please send a valid image or video."
+        except aiohttp.ClientError as e:
+            # The decode guard in FaceDetector still applies, so do not fail the user on a network hiccup
+            logger.error(f"Error probing media header of {attachment.filename}: {e}")
+            return None
+
+        reason = check_limits(
+            info,
+            max_pixels=max_pixels,
+            max_duration=limits.get('max_video_seconds'),
+            max_frames=limits.get('max_frames')
+        )
+        if reason:
+            logger.warning(f"Rejected {attachment.filename} before download: {reason}")
+            return f"{reason}. Please send a smaller file."
+        return None
+
+    async def analyze_media(self, media_data, media_type):
+        """Run the face analysis; returns (estimated_age, error, analysis, cacheable)
+
+        analysis is the AnalysisResult holding the face descriptor, liveness
+        score and landmarks, or None if the media was rejected.
+        """
+        # Photos get the spoof check and age estimate from a single analysis pass
+        if media_type == 'photo':
+            analysis = await self.inference.analyze(media_data)
+            if analysis.transient:
+                raise TransientAnalysisError(analysis.reason)
+            self.cascade_stats.record(analysis.checks)
+            self.stage_stats.record(media_type, analysis.timings)
+            if analysis.is_spoof:
+                return None, f"Verification failed: {analysis.reason}", None, True
+        else:
+            analysis = await self.inference.analyze_video(media_data)
+            if analysis.transient:
+                raise TransientAnalysisError(analysis.error)
+            self.stage_stats.record(media_type, analysis.timings)
+            if analysis.estimated_age is None:
+                # Failed video runs may be timeouts, so only successes are cached
+                return None, f"Error in verification: {analysis.error}", None, False
+
+        if analysis.error:
+            return None, f"Error in verification: {analysis.error}", analysis, True
+
+        if analysis.estimated_age is None:
+            return None, "Could not estimate age from the provided media", analysis, True
+
+        return analysis.estimated_age, None, analysis, True
+
+    async def process_media(self, media_data, media_type, user_id, username):
+        """Process image or video for age verification
+
+        Returns (estimated_age, error, liveness, review_flags) where liveness is
+        the video liveness score (None for photos) and review_flags lists warnings
+        for the moderators, such as media or faces shared with other accounts.
+        """
+        try:
+            # Hashing a multi-megabyte upload is CPU work, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            fingerprint = await loop.run_in_executor(
+                None, self.media_cache.fingerprint, media_data, media_type
+            )
+
+            entry = self.media_cache.get(fingerprint)
+            if entry is not None:
+                logger.info(f"Reusing cached analysis for media {fingerprint.sha256[:12]} from {user_id}")
+                estimated_age, error, analysis = entry.estimated_age, entry.error, entry.analysis
+            else:
+                estimated_age, error, analysis, cacheable = await self.analyze_media(media_data, media_type)
+                if cacheable:
+                    entry = self.media_cache.put(fingerprint, estimated_age, error, analysis)
+            descriptor = analysis.descriptor if analysis is not None else None
+            liveness = analysis.liveness if analysis is not None else None
+
+            review_flags = []
+            if entry is not None:
+                shared_with = self.media_cache.record_submitter(entry, user_id)
+                if shared_with:
+                    review_flags.append(
+                        "Same media was also submitted by: " + ", ".join(sorted(shared_with))
+                    )
+
+            if descriptor is not None:
+                review_flags.extend(self.check_face(descriptor, user_id))
+
+            if analysis is not None and analysis.static_animation:
+                # Wrapping a still photo as a GIF or APNG dodges the checks that only run on photos
+                review_flags.append("Animated image whose frames are all the same still picture")
+
+            for flag in review_flags:
+                logger.warning(f"Verification from {user_id}: {flag}")
 
             if error:
-                return None, f"Error in verification: {error}"
+                return None, error, None, review_flags
 
-            if estimated_age is None:
-                return None, "Could not estimate age from the provided media"
+            # Stats count the submission for the first server the member shares with the bot
+            user = self.bot.get_user(int(user_id))
+            guild_id = str(user.mutual_guilds[0].id) if user and user.mutual_guilds else None
 
             # Store verification data in database
-            verification_id = self.db.add_verification(
+            verification_id = await self.db.add_verification(
                 user_id=str(user_id),
                 username=username,
                 media_data=media_data,
                 media_type=media_type,
-                estimated_age=estimated_age
+                estimated_age=estimated_age,
+                face_descriptor=encode_descriptor(descriptor) if descriptor is not None else None,
+                liveness_score=liveness,
+                landmarks=analysis.packed_landmarks if analysis is not None else None,
+                guild_id=guild_id
             )
+            if descriptor is not None:
+                # Index at the stored float16 precision so results match a rebuild
+                self.face_index.add(str(user_id), decode_descriptor(encode_descriptor(descriptor)))
 
-            return estimated_age, None
+            return estimated_age, None, liveness, review_flags
 
+        except TransientAnalysisError:
+            # The job queue retries these later
+            raise
         except Exception as e:
             logger.error(f"Error processing media: {str(e)}")
-            return None, f"Error processing verification: {str(e)}"
+            return None, f"Error processing verification: {str(e)}", None, []
+
+    async def run_queue_worker(self):
+        """Claim and process queued verification jobs until cancelled"""
+        lease_seconds = self.queue_settings.get('lease_seconds', 300)
+        poll_seconds = self.queue_settings.get('poll_seconds', 5)
+        while True:
+            try:
+                job = await self.db.claim_job(lease_seconds)
+                if job is None:
+                    # Woken early by new submissions; the timeout picks up retries that became due
+                    self.queue_event.clear()
+                    try:
+                        await asyncio.wait_for(self.queue_event.wait(), timeout=poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in verification queue worker: {e}")
+                await asyncio.sleep(poll_seconds)
+
+    async def run_job(self, job):
+        """Process one claimed job, retrying transient failures with exponential backoff"""
+        max_attempts = self.queue_settings.get('max_attempts', 4)
+        if job.attempts > max_attempts:
+            # Claimed again after its lease expired on the last attempt, e.g. a crash mid-job
+            await self.db.finish_job(job.id, job.last_error or "Job did not finish")
+            await self.post_result(job, None, "Verification could not be processed, please try again later.", None, [])
+            return
+
+        try:
+            age, error, liveness, review_flags = await self.process_media(
+                job.media_data, job.media_type, job.user_id, job.username
+            )
+        except TransientAnalysisError as e:
+            if job.attempts >= max_attempts:
+                logger.error(f"Verification job {job.id} failed after {job.attempts} attempts: {e}")
+                await self.db.finish_job(job.id, str(e))
+                await self.post_result(job, None, "Verification could not be processed, please try again later.", None, [])
+                return
+            delay = min(
+                self.queue_settings.get('retry_base_seconds', 30) * 2 ** (job.attempts - 1),
+                self.queue_settings.get('retry_max_seconds', 900)
+            )
+            logger.warning(f"Verification job {job.id} attempt {job.attempts} failed, retrying in {delay}s: {e}")
+            await self.db.retry_job(job.id, str(e), delay)
+            return
+
+        await self.db.finish_job(job.id, error)
+        await self.post_result(job, age, error, liveness, review_flags)
+
+    async def run_retention_worker(self):
+        """Enforce the retention periods every interval_minutes until cancelled"""
+        interval = self.retention_settings.get('interval_minutes', 60) * 60
+        while True:
+            try:
+                await self.enforce_retention()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in retention purge: {e}")
+            await asyncio.sleep(interval)
+
+    async def purge_batches(self, purge, cutoff):
+        """Run a Database purge method batch by batch; returns (rows, blob bytes) summed over batches
+
+        Each batch is its own short write transaction, and the pause between
+        them lets submissions and reviews take the write lock.
+        """
+        batch_size = self.retention_settings.get('batch_size', 200)
+        pause = self.retention_settings.get('pause_ms', 50) / 1000
+        rows = freed = 0
+        after_id = 0
+        while True:
+            after_id, count, *blob_bytes = await purge(cutoff, after_id, batch_size)
+            if after_id is None:
+                return rows, freed
+            rows += count
+            freed += sum(blob_bytes)
+            await asyncio.sleep(pause)
+
+    async def enforce_retention(self):
+        """Purge data past privacy.data_retention_days and media past media_retention_days"""
+        start = time.monotonic()
+        now = datetime.utcnow()
+        data_cutoff = now - timedelta(days=config['privacy']['data_retention_days'])
+        media_cutoff = now - timedelta(days=config['verification_settings']['media_retention_days'])
+
+        media, media_bytes = await self.purge_batches(self.db.purge_expired_media, media_cutoff)
+        verifications, row_bytes = await self.purge_batches(self.db.purge_expired_verifications, data_cutoff)
+        jobs, _ = await self.purge_batches(self.db.purge_finished_jobs, data_cutoff)
+        audit, _ = await self.purge_batches(self.db.purge_audit_entries, data_cutoff)
+
+        # Hand the freed database pages back to the file system a slice at a time
+        reclaimed = 0
+        vacuum_pages = self.retention_settings.get('vacuum_pages', 1000)
+        while True:
+            freed, remaining = await self.db.reclaim_space(vacuum_pages)
+            reclaimed += freed
+            if not freed or not remaining:
+                break
+            await asyncio.sleep(self.retention_settings.get('pause_ms', 50) / 1000)
+
+        report = {
+            'verifications': verifications,
+            'media': media,
+            'jobs': jobs,
+            'audit_entries': audit,
+            'media_bytes': media_bytes + row_bytes,
+            'reclaimed_bytes': reclaimed,
+            'seconds': time.monotonic() - start,
+        }
+        logger.info(
+            f"Retention purge: {verifications} verifications, media of {media} more, {jobs} jobs and "
+            f"{audit} audit entries removed; {report['media_bytes'] / 1e6:.1f} MB of media freed, "
+            f"{reclaimed / 1e6:.1f} MB of database reclaimed in {report['seconds']:.1f}s"
+        )
+        return report
+
+    async def post_result(self, job, age, error, liveness, review_flags):
+        """Tell the user and the moderators how a processed job turned out"""
+        await self.db.add_audit_entry(
+            'verification_processed', job.user_id, details=error or f"estimated age {age:.1f}"
+        )
+        user_id = int(job.user_id)
+        user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+
+        if error:
+            try:
+                await user.send(error)
+            except discord.HTTPException as e:
+                logger.error(f"Failed to send verification result to {user_id}: {e}")
+            return
+
+        # Add awaiting review role and notify user
+        for guild in user.mutual_guilds:
+            member = guild.get_member(user_id)
+            if member:
+                try:
+                    # Add awaiting review role
+                    awaiting_role = discord.utils.get(
+                        guild.roles,
+                        name=config['roles']['awaiting_review']
+                    )
+                    if awaiting_role:
+                        await member.add_roles(awaiting_role)
+                except discord.Forbidden:
+                    logger.error(f"Failed to add awaiting review role to {user_id} in {guild.name}")
+
+        # Initial age check and notify moderators
+        is_potentially_underage = age < config['verification_settings']['min_age']
+        status_msg = (
+            "⚠️ Initial age check suggests you may be under 13. "
+            if is_potentially_underage else
+            "✅ Initial age check passed. "
+        ) + "Your submission is now awaiting staff review."
+
+        try:
+            await user.send(status_msg)
+        except discord.HTTPException as e:
+            logger.error(f"Failed to send verification result to {user_id}: {e}")
+
+        # Notify moderators
+        for guild in user.mutual_guilds:
+            try:
+                mod_channel = discord.utils.get(guild.channels, name=config['channels']['mod_logs'])
+                if mod_channel:
+                    embed = discord.Embed(
+                        title="⚠️ Age Verification Review Required" if is_potentially_underage else "Age Verification Review",
+                        color=discord.Color.red() if is_potentially_underage else discord.Color.blue(),
+                        timestamp=datetime.now()
+                    )
+                    embed.add_field(name="User", value=f"{job.username} ({user_id})", inline=False)
+                    embed.add_field(name="Estimated Age", value=f"{age:.1f}", inline=True)
+                    embed.add_field(name="Media Type", value=job.filename.split('.')[-1].upper(), inline=True)
+                    if liveness is not None:
+                        embed.add_field(name="Liveness", value=f"{liveness:.2f}", inline=True)
+                    if review_flags:
+                        embed.add_field(
+                            name="⚠️ Flags",
+                            value="\n".join(review_flags),
+                            inline=False
+                        )
+                    embed.add_field(
+                        name="Status",
+                        value="⚠️ POTENTIAL UNDERAGE USER" if is_potentially_underage else "Awaiting Review",
+                        inline=False
+                    )
+
+                    await mod_channel.send(
+                        content="@here - Urgent review required!" if is_potentially_underage else None,
+                        embed=embed
+                    )
+            except Exception as e:
+                logger.error(f"Failed to notify moderators in {guild.name}: {e}")
+
+        # Set cooldown
+        self.verification_cooldowns[user_id] = datetime.now() + timedelta(
+            minutes=config['verification_settings']['cooldown_minutes']
+        )
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -105,7 +571,16 @@ class Verification(commands.Cog):
                 )
                 return
 
-        # Process verification
+        # One submission per user in the queue at a time
+        active_job = await self.db.get_active_job(str(user_id))
+        if active_job:
+            position = await self.db.queue_position(active_job.id)
+            await message.channel.send(
+                f"Your verification is already queued (position {position}). Please wait for the result."
+            )
+            return
+
+        # Queue the first valid attachment
         for attachment in message.attachments:
             if not any(attachment.filename.lower().endswith(ext) 
                       for ext in ['.png', '.jpg', '.jpeg', '.gif', '.mp4', '.mov']):
@@ -114,72 +589,31 @@ class Verification(commands.Cog):
                 )
                 continue
 
-            await message.channel.send("Processing your verification... Please wait.")
-
-            age, error = await self.process_media(attachment, user_id, username)
+            limit_error = await self.check_media_limits(attachment)
+            if limit_error:
+                await message.channel.send(limit_error)
+                continue
 
-            if error:
-                await message.channel.send(error)
+            try:
+                media_data = await attachment.read()
+            except discord.HTTPException as e:
+                logger.error(f"Failed to download verification media from {user_id}: {e}")
+                await message.channel.send("Could not download your file, please send it again.")
                 continue
 
-            # Add awaiting review role and notify user
-            for guild in message.author.mutual_guilds:
-                member = guild.get_member(user_id)
-                if member:
-                    try:
-                        # Add awaiting review role
-                        awaiting_role = discord.utils.get(
-                            guild.roles,
-                            name=config['roles']['awaiting_review']
-                        )
-                        if awaiting_role:
-                            await member.add_roles(awaiting_role)
-                    except discord.Forbidden:
-                        logger.error(f"Failed to add awaiting review role to {user_id} in {guild.name}")
-
-            # Initial age check and notify moderators
-            is_potentially_underage = age < config['verification_settings']['min_age']
-            status_msg = (
-                "⚠️ Initial age check suggests you may be under 13. "
-                if is_potentially_underage else
-                "✅ Initial age check passed. "
-            ) + "Your submission is now awaiting staff review."
-
-            await message.channel.send(status_msg)
-
-            # Notify moderators
-            for guild in message.author.mutual_guilds:
-                try:
-                    mod_channel = discord.utils.get(guild.channels, name=config['channels']['mod_logs'])
-                    if mod_channel:
-                        embed = discord.Embed(
-                            title="⚠️ Age Verification Review Required" if is_potentially_underage else "Age Verification Review",
-                            color=discord.Color.red() if is_potentially_underage else discord.Color.blue(),
-                            timestamp=datetime.now()
-                        )
-                        embed.add_field(name="User", value=f"{username} ({user_id})", inline=False)
-                        embed.add_field(name="Estimated Age", value=f"{age:.1f}", inline=True)
-                        embed.add_field(name="Media Type", value=attachment.filename.split('.')[-1].upper(), inline=True)
-                        embed.add_field(
-                            name="Status",
-                            value="⚠️ POTENTIAL UNDERAGE USER" if is_potentially_underage else "Awaiting Review",
-                            inline=False
-                        )
-                        
-                        await mod_channel.send(
-                            content="@here - Urgent review required!" if is_potentially_underage else None,
-                            embed=embed
-                        )
-                except Exception as e:
-                    logger.error(f"Failed to notify moderators in {guild.name}: {e}")
+            media_type = 'video' if attachment.filename.lower().endswith(('.mp4', '.mov')) else 'photo'
+            job_id = await self.db.enqueue_job(str(user_id), username, attachment.filename, media_type, media_data)
+            self.queue_event.set()
+            await self.db.add_audit_entry('verification_queued', str(user_id), details=f"job {job_id}, {media_type}")
 
-            # Set cooldown
-            self.verification_cooldowns[user_id] = datetime.now() + timedelta(
-                minutes=config['verification_settings']['cooldown_minutes']
+            position = await self.db.queue_position(job_id)
+            logger.info(f"Queued verification job {job_id} for {user_id} at position {position}")
+            await message.channel.send(
+                f"Your verification is queued, position {position}. "
+                "You will get a message here once it has been processed."
             )
             break
 
 async def setup(bot):
     """Set up the Verification cog"""
     await bot.add_cog(Verification(bot))
-</create_file>
@@ -0,0 +1,244 @@
+"""
+Offline re-evaluation of stored verifications
+
+Streams the verifications table in id order, re-runs the current face
+analysis pipeline on every stored photo and video in a pool of worker
+processes and writes the new estimates next to the stored ones as CSV.
+Progress is checkpointed after every chunk, so an interrupted run resumes
+where it stopped:
+
+    age-verify-reevaluate --output reevaluation.csv --workers 4
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+from src.utils.database import Database
+from src.utils.inference import InferenceExecutor, TIMEOUT_MESSAGE
+
+logger = logging.getLogger('age-verify-bot')
+
+OUTPUT_FIELDS = ['id', 'user_id', 'media_type', 'stored_age', 'new_age', 'change', 'error']
+MEDIA_MISSING = "Media was purged or is missing from the blob store"
+
+
+class ReevaluationInterrupted(Exception):
+    """Raised when a row could not be analysed this run; resuming from the checkpoint redoes it"""
+
+
+class ReevaluationStats:
+    """Running totals and throughput of a re-evaluation run"""
+
+    def __init__(self, rows=0, changed=0, errors=0, media_bytes=0, elapsed_seconds=0.0):
+        self.rows = rows
+        self.changed = changed
+        self.errors = errors
+        self.media_bytes = media_bytes
+        # Time spent by earlier runs that this one resumes
+        self.previous_seconds = elapsed_seconds
+        self.started = time.monotonic()
+
+    @property
+    def elapsed_seconds(self):
+        return self.previous_seconds + time.monotonic() - self.started
+
+    def record(self, media_bytes, changed, error):
+        self.rows += 1
+        self.media_bytes += media_bytes
+        self.changed += bool(changed)
+        self.errors += bool(error)
+
+    def summary(self):
+        elapsed = max(self.elapsed_seconds, 1e-9)
+        return (
+            f"{self.rows} rows, {self.changed} changed, {self.errors} errors in {elapsed:.1f}s "
+            f"({self.rows / elapsed:.1f} rows/s, {self.media_bytes / elapsed / 1024 / 1024:.1f} MiB/s)"
+        )
+
+
+def load_checkpoint(path):
+    """Read a checkpoint written by save_checkpoint, or None if there is none"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, last_id, output_offset, stats):
+    """Atomically record how far the run got"""
+    checkpoint = {
+        'last_id': last_id,
+        'output_offset': output_offset,
+        'rows': stats.rows,
+        'changed': stats.changed,
+        'errors': stats.errors,
+        'media_bytes': stats.media_bytes,
+        'elapsed_seconds': stats.elapsed_seconds,
+    }
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temporary, path)
+
+
+async def analyze_row(executor, media_type, media_data):
+    """Re-run the analysis for one stored submission; returns (new_age, error, retry)
+
+    retry is set when the analysis failed for a reason of this run, a worker
+    crash or a timeout, rather than because of the media itself.
+    """
+    if media_type == 'video':
+        analysis = await executor.analyze_video(media_data)
+    else:
+        analysis = await executor.analyze(media_data)
+    retry = analysis.transient or TIMEOUT_MESSAGE in (analysis.reason, analysis.error)
+    if analysis.is_spoof:
+        return None, analysis.reason, retry
+    return analysis.estimated_age, analysis.error, retry
+
+
+async def evaluate_row(executor, db, row, slots):
+    """Read one row's media and analyse it once one of the slots is free
+
+    Rows whose media was purged by retention or whose blob is gone are not
+    analysed and are recorded with MEDIA_MISSING as their error.
+    """
+    async with slots:
+        try:
+            media_data = db.read_media(row)
+        except FileNotFoundError:
+            logger.warning(f"Blob {row.media_digest} of verification {row.id} is missing")
+            media_data = None
+        if not media_data:
+            return None, MEDIA_MISSING, False
+        return await analyze_row(executor, row.media_type, media_data)
+
+
+def submit_chunk(executor, db, chunk, slots):
+    """Start evaluating every row of a chunk; slots bounds how many are read and analysed at once"""
+    return [(row, asyncio.ensure_future(evaluate_row(executor, db, row, slots))) for row in chunk]
+
+
+async def reevaluate(args, detector_options, inference_options, database_options=None):
+    """Run the re-evaluation described by the parsed command line arguments"""
+    checkpoint = None if args.restart else load_checkpoint(args.checkpoint)
+    if checkpoint and not os.path.exists(args.output):
+        logger.warning(f"Checkpoint {args.checkpoint} has no output file {args.output}, starting over")
+        checkpoint = None
+    if checkpoint:
+        last_id = checkpoint['last_id']
+        stats = ReevaluationStats(
+            checkpoint['rows'], checkpoint['changed'], checkpoint['errors'],
+            checkpoint['media_bytes'], checkpoint['elapsed_seconds']
+        )
+        logger.info(f"Resuming after verification {last_id}: {stats.summary()}")
+    else:
+        last_id = 0
+        stats = ReevaluationStats()
+
+    executor = InferenceExecutor(
+        max_workers=args.workers,
+        timeout=inference_options.get('job_timeout_seconds', 30),
+        max_retries=inference_options.get('max_retries', 1),
+        detector_options=detector_options
+    )
+    await executor.start()
+
+    db = None
+    output = open(args.output, 'a+' if checkpoint else 'w', newline='')
+    try:
+        if checkpoint:
+            # Rows written after the last checkpoint are redone, so drop them
+            output.truncate(checkpoint['output_offset'])
+            output.seek(checkpoint['output_offset'])
+        writer = csv.writer(output)
+        if output.tell() == 0:
+            writer.writerow(OUTPUT_FIELDS)
+
+        # Same database and blob store as the bot; threads only applies to its AsyncDatabase
+        db = Database(**{
+            key: value for key, value in (database_options or {}).items() if key != 'threads'
+        })
+        chunks = db.iter_verification_chunks(after_id=last_id, chunk_size=args.chunk_size)
+        # Keep the next chunk queued while the current one is collected, so the
+        # workers do not idle at chunk boundaries; only one row per worker is
+        # read and analysed at a time
+        slots = asyncio.Semaphore(args.workers)
+        in_flight = submit_chunk(executor, db, next(chunks, []), slots)
+        while in_flight:
+            upcoming = submit_chunk(executor, db, next(chunks, []), slots)
+
+            failed = None
+            for row, future in in_flight:
+                new_age, error, retry = await future
+                if retry:
+                    # Stop before this row, so the checkpoint leaves it to the next run
+                    failed = (row, error)
+                    break
+                change = None
+                if new_age is not None and row.estimated_age is not None:
+                    change = new_age - row.estimated_age
+                writer.writerow([
+                    row.id, row.user_id, row.media_type, row.estimated_age,
+                    new_age, change, error or ''
+                ])
+                stats.record(row.media_size or 0, change, error)
+                last_id = row.id
+
+            output.flush()
+            save_checkpoint(args.checkpoint, last_id, output.tell(), stats)
+            logger.info(f"Re-evaluated up to verification {last_id}: {stats.summary()}")
+            if failed:
+                for _, future in in_flight + upcoming:
+                    future.cancel()
+                await asyncio.gather(*(future for _, future in in_flight + upcoming), return_exceptions=True)
+                row, error = failed
+                raise ReevaluationInterrupted(
+                    f"Verification {row.id} could not be analysed ({error}), "
+                    f"stopped after verification {last_id}; run again to resume"
+                )
+            in_flight = upcoming
+    finally:
+        output.close()
+        if db is not None:
+            db.close()
+        executor.shutdown()
+
+    logger.info(f"Re-evaluation finished: {stats.summary()}")
+    return stats
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Re-run face analysis on stored verifications")
+    parser.add_argument('--output', default='reevaluation.csv', help="CSV file for the new estimates")
+    parser.add_argument('--checkpoint', default='reevaluation.checkpoint.json',
+                        help="Progress file used to resume an interrupted run")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Analysis worker processes")
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help="Rows read from the database at a time")
+    args = parser.parse_args()
+
+    with open(os.path.join('config', 'config.json'), 'r') as f:
+        config = json.load(f)
+
+    try:
+        stats = asyncio.run(reevaluate(
+            args, config.get('face_detection', {}), config.get('inference', {}), config.get('database', {})
+        ))
+    except ReevaluationInterrupted as e:
+        logger.error(str(e))
+        raise SystemExit(1)
+    print(stats.summary())
+
+
+if __name__ == '__main__':
+    main()
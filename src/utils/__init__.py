@@ -14,9 +14,10 @@ if project_root not in sys.path:
 # Import utilities
 from src.utils.database import Database
 from src.utils.face_detection import FaceDetector
+from src.utils.detector_registry import get_detector
 
 # Make utilities available at package level
-__all__ = ['Database', 'FaceDetector']
+__all__ = ['Database', 'FaceDetector', 'get_detector']
 
 # Initialize logging
 import logging
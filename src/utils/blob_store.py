@@ -0,0 +1,71 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger('age-verify-bot')
+
+DIGEST_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+class BlobStore:
+    """Content-addressed media files on disk, sharded by the leading hex digits of their SHA-256
+
+    A blob lives at root/ab/cd/abcd..., so identical media is stored once and
+    no directory grows past 256 entries per level. Blobs are written under a
+    temporary name and renamed into place, so a reader never sees a partial file.
+    """
+
+    def __init__(self, root='media_store'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        if not DIGEST_PATTERN.fullmatch(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, data):
+        """Store data if it is not stored yet; returns its SHA-256 hex digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return digest
+
+    def open(self, digest):
+        """Binary file object for streaming a blob, e.g. as a Discord upload"""
+        return open(self.path(digest), 'rb')
+
+    def read(self, digest):
+        """A blob's whole content"""
+        with self.open(digest) as f:
+            return f.read()
+
+    def delete(self, digest):
+        """Remove a blob; returns the number of bytes freed"""
+        path = self.path(digest)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
@@ -1,7 +1,22 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, LargeBinary, Boolean, Float
+from sqlalchemy import create_engine, event, and_, case, cast, exists, func, literal_column, or_, Column, Index, Integer, String, Date, DateTime, LargeBinary, Boolean, Float
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.orm import aliased, deferred, sessionmaker
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import asyncio
+import functools
+import io
+import logging
+import threading
+import time
+
+from src.utils.blob_store import BlobStore
+from src.utils.migrations import backfill_daily_stats, run_migrations
+
+logger = logging.getLogger('age-verify-bot')
 
 Base = declarative_base()
 
@@ -11,8 +26,13 @@ class Verification(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(String, nullable=False)
     username = Column(String, nullable=False)
+    guild_id = Column(String, nullable=True)  # guild the submission counts for in daily_stats
     submission_date = Column(DateTime, default=datetime.utcnow)
-    media_data = Column(LargeBinary, nullable=False)
+    # Inline media from before the blob store; empty once moved there. Deferred, like the
+    # other binary columns, so listing verifications never loads it.
+    media_data = deferred(Column(LargeBinary, nullable=False, default=b''))
+    media_digest = Column(String(64), nullable=True)  # SHA-256 of the media in the BlobStore
+    media_size = Column(Integer, nullable=True)
     media_type = Column(String, nullable=False)  # 'photo' or 'video'
     estimated_age = Column(Float)
     verified = Column(Boolean, default=False)
@@ -20,57 +40,1159 @@ class Verification(Base):
     reviewer_id = Column(String, nullable=True)
     review_date = Column(DateTime, nullable=True)
     review_notes = Column(String, nullable=True)
+    face_descriptor = deferred(Column(LargeBinary, nullable=True))  # float16 landmark geometry, see face_index
+    liveness_score = Column(Float, nullable=True)  # 0..1 face motion in video submissions
+    landmarks = deferred(Column(LargeBinary, nullable=True))  # packed float16 mesh landmarks, see landmark_store
+
+class VerificationJob(Base):
+    __tablename__ = 'verification_jobs'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    username = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    media_type = Column(String, nullable=False)  # 'photo' or 'video'
+    media_data = Column(LargeBinary, nullable=True)  # cleared once the job is finished
+    status = Column(String, nullable=False, default='queued')  # queued, running, done or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow)  # not claimed before this, for retry backoff
+    lease_expires = Column(DateTime, nullable=True)  # a running job past its lease is claimed again
+    finished_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+
+class Appeal(Base):
+    __tablename__ = 'appeals'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    appeal_msg_id = Column(String, nullable=True)
+    reason = Column(String, nullable=False)
+    claimed_age = Column(String, nullable=True)
+    proof = Column(String, nullable=True)
+    reconsideration = Column(String, nullable=True)
+    status = Column(String, nullable=False, default='pending')  # pending, accepted or denied
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AuditEntry(Base):
+    __tablename__ = 'audit_log'
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    action = Column(String, nullable=False)  # e.g. verification_queued, verification_reviewed
+    user_id = Column(String, nullable=True)  # member the entry is about
+    actor_id = Column(String, nullable=True)  # staff member who acted, if any
+    details = Column(String, nullable=True)
+
+class BannedUser(Base):
+    __tablename__ = 'banned_users'
+
+    # One row per guild that banned the user; the face index flags a user banned anywhere
+    user_id = Column(String, primary_key=True)
+    guild_id = Column(String, primary_key=True)
+    banned_at = Column(DateTime, default=datetime.utcnow)
+
+# Rollup behind the stats commands, one row per guild and UTC day. Submissions count on
+# the day they were made, decisions and their processing time on the day of the review.
+# add_verification and update_review keep it current in their own transactions, and
+# migration 5 or rebuild_daily_stats fills it from the verifications table.
+class DailyStats(Base):
+    __tablename__ = 'daily_stats'
+
+    guild_id = Column(String, primary_key=True)  # '' for verifications without a guild, counted for every guild
+    day = Column(Date, primary_key=True)
+    submissions = Column(Integer, nullable=False, default=0)
+    approvals = Column(Integer, nullable=False, default=0)
+    rejections = Column(Integer, nullable=False, default=0)
+    processing_seconds = Column(Float, nullable=False, default=0.0)  # summed submission to review times
+    processed = Column(Integer, nullable=False, default=0)
+
+DAILY_COUNTERS = ('submissions', 'approvals', 'rejections', 'processing_seconds', 'processed')
+
+def bump_daily_stats(session, guild_id, day, **deltas):
+    """Add deltas to a guild's daily_stats row in the session's transaction, creating the row if needed"""
+    values = {name: 0 for name in DAILY_COUNTERS}
+    values.update(deltas)
+    statement = sqlite_insert(DailyStats).values(guild_id=guild_id or '', day=day, **values)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[DailyStats.guild_id, DailyStats.day],
+        set_={name: getattr(DailyStats, name) + value for name, value in deltas.items()}
+    ))
+
+def count_review(session, verification, sign=1):
+    """Add (sign=1) or take back (sign=-1) a review decision in daily_stats"""
+    seconds = (verification.review_date - verification.submission_date).total_seconds()
+    bump_daily_stats(
+        session, verification.guild_id, verification.review_date.date(),
+        approvals=sign if verification.verified else 0,
+        rejections=0 if verification.verified else sign,
+        processing_seconds=sign * seconds,
+        processed=sign
+    )
+
+def daily_stats_query(session, guild_id, start=None, end=None):
+    """daily_stats rows of a guild, and those without a guild, for days from start to end inclusive"""
+    query = session.query(DailyStats).filter(DailyStats.guild_id.in_((guild_id, '')))
+    if start is not None:
+        query = query.filter(DailyStats.day >= start)
+    if end is not None:
+        query = query.filter(DailyStats.day <= end)
+    return query
+
+def merge_daily_stats(rows, days=()):
+    """{day: counters} summing the rows of each day; days lists days to include even without rows"""
+    totals = {day: {'day': day, **{name: 0 for name in DAILY_COUNTERS}} for day in days}
+    for row in rows:
+        day = totals.setdefault(row.day, {'day': row.day, **{name: 0 for name in DAILY_COUNTERS}})
+        for name in DAILY_COUNTERS:
+            day[name] += getattr(row, name)
+    return dict(sorted(totals.items()))
+
+def mean_processing_minutes(days):
+    """Mean submission to review time in minutes over merged daily_stats counters, 0.0 without reviews"""
+    processed = sum(day['processed'] for day in days)
+    return sum(day['processing_seconds'] for day in days) / 60 / processed if processed else 0.0
+
+def guild_verifications(guild_id):
+    """Filter for the verifications of a guild, and those without one"""
+    # An OR of plain column tests, which SQLite can answer from (..., guild_id, ...) indexes
+    return or_(Verification.guild_id == guild_id, Verification.guild_id.is_(None))
+
+def staff_review_stats_query(session, since=None, min_age=13, guild_id=None):
+    """Per reviewer: reviews, approvals, decisions agreeing with the age estimate, and review latency
+
+    Latency is minutes from submission to review; its median and 90th
+    percentile are nearest-rank values, from each review's rank among its
+    reviewer's reviews. guild_id limits it to the reviews of that guild's queue.
+    """
+    latency = (func.julianday(Verification.review_date) - func.julianday(Verification.submission_date)) * 1440
+    reviews = session.query(
+        Verification.reviewer_id,
+        Verification.verified,
+        Verification.estimated_age,
+        latency.label('latency'),
+        func.row_number().over(partition_by=Verification.reviewer_id, order_by=latency).label('rank'),
+        func.count().over(partition_by=Verification.reviewer_id).label('reviews')
+    ).filter(
+        # A review date implies a review, and lets the window be a range of its index
+        Verification.review_date.isnot(None),
+        Verification.reviewer_id.isnot(None)
+    )
+    if since is not None:
+        reviews = reviews.filter(Verification.review_date >= since)
+    if guild_id is not None:
+        reviews = reviews.filter(guild_verifications(guild_id))
+    reviews = reviews.subquery()
+
+    def percentile(fraction):
+        return func.min(case((reviews.c.rank >= reviews.c.reviews * fraction, reviews.c.latency)))
+
+    return session.query(
+        reviews.c.reviewer_id,
+        func.count().label('total'),
+        func.sum(case((reviews.c.verified == True, 1), else_=0)).label('approvals'),
+        func.sum(case(
+            (and_(reviews.c.verified == True, reviews.c.estimated_age >= min_age), 1),
+            (and_(reviews.c.verified == False, reviews.c.estimated_age < min_age), 1),
+            else_=0
+        )).label('agreed'),
+        func.avg(reviews.c.latency).label('avg_time'),
+        percentile(0.5).label('p50_time'),
+        percentile(0.9).label('p90_time')
+    ).group_by(reviews.c.reviewer_id)
+
+def age_histogram_query(session, bin_years=2, guild_id=None):
+    """(bin start, count) of verified members' estimated ages in bin_years wide bins"""
+    bin_start = (cast(Verification.estimated_age / bin_years, Integer) * bin_years).label('bin_start')
+    query = session.query(bin_start, func.count().label('count')).filter(
+        Verification.verified == True,
+        Verification.estimated_age.isnot(None)
+    )
+    if guild_id is not None:
+        query = query.filter(guild_verifications(guild_id))
+    return query.group_by(bin_start).order_by(bin_start)
+
+# Indexes for the hot query shapes; existing databases get them from migration 2
+Index('ix_verifications_reviewed_submitted', Verification.reviewed, Verification.submission_date)
+Index('ix_verifications_user_submitted', Verification.user_id, Verification.submission_date.desc())
+Index('ix_verifications_submitted', Verification.submission_date)
+Index('ix_verifications_media_digest', Verification.media_digest)
+Index('ix_verification_jobs_status_available', VerificationJob.status, VerificationJob.available_at)
+Index('ix_verification_jobs_user_status', VerificationJob.user_id, VerificationJob.status)
+# Covering the age histogram, and the review window of the staff statistics; from migration 6
+Index('ix_verifications_verified_age', Verification.verified, Verification.estimated_age, Verification.guild_id)
+Index('ix_verifications_review_date', Verification.review_date)
+# The same window for one guild's staff statistics; from migration 8
+Index('ix_verifications_guild_review_date', Verification.guild_id, Verification.review_date)
+
+# Review queue orderings as (sort key, descending); pages are keyset ranges on (key, id).
+# Submissions without a liveness score (photos) sort last, those without an age estimate
+# first. The sentinels are literals so the keys match the expression indexes below.
+REVIEW_ORDERS = {
+    'oldest': (Verification.submission_date, False),
+    'newest': (Verification.submission_date, True),
+    'liveness': (func.coalesce(Verification.liveness_score, literal_column('2.0')), False),
+    'age': (func.coalesce(Verification.estimated_age, literal_column('0.0')), False),
+}
+# One per review order, so a guild's queue (or the rows without a guild) is an ordered range;
+# existing databases get them from migration 7, which drops the guild-less ones of migration 3
+Index('ix_verifications_reviewed_guild_submitted', Verification.reviewed, Verification.guild_id,
+      Verification.submission_date)
+Index('ix_verifications_reviewed_guild_liveness', Verification.reviewed, Verification.guild_id,
+      REVIEW_ORDERS['liveness'][0])
+Index('ix_verifications_reviewed_guild_age', Verification.reviewed, Verification.guild_id,
+      REVIEW_ORDERS['age'][0])
+
+# Metadata shown in the review queue; never the media or landmark blobs
+REVIEW_COLUMNS = (
+    Verification.id,
+    Verification.user_id,
+    Verification.username,
+    Verification.submission_date,
+    Verification.media_type,
+    Verification.estimated_age,
+    Verification.liveness_score,
+)
+
+def pending_reviews_query(session, order='oldest', guild_id=None):
+    """Unreviewed submissions of a guild (None: without a guild) that are their user's latest, unordered
+
+    Rows carry their sort key. The queue a guild's staff sees is this query
+    for the guild together with the one for None, see get_review_page.
+    """
+    key, descending = REVIEW_ORDERS[order]
+    later = aliased(Verification)
+    return session.query(*REVIEW_COLUMNS, key.label('sort_key')).filter(
+        Verification.reviewed == False,
+        Verification.guild_id == guild_id if guild_id is not None else Verification.guild_id.is_(None),
+        ~exists().where(and_(
+            later.user_id == Verification.user_id,
+            later.submission_date > Verification.submission_date
+        ))
+    )
+
+def review_page_query(session, order='oldest', cursor=None, backwards=False, guild_id=None):
+    """pending_reviews_query in queue order (reversed when backwards), starting after cursor"""
+    key, descending = REVIEW_ORDERS[order]
+    query = pending_reviews_query(session, order, guild_id)
+    scan_descending = descending != backwards
+    if cursor is not None:
+        # (key, id) past the cursor, spelled so the key bound alone can start an index range;
+        # SQLite does not use row-value comparisons on expression indexes
+        cursor_key, cursor_id = cursor
+        if scan_descending:
+            query = query.filter(key <= cursor_key, or_(key < cursor_key, Verification.id < cursor_id))
+        else:
+            query = query.filter(key >= cursor_key, or_(key > cursor_key, Verification.id > cursor_id))
+    if scan_descending:
+        return query.order_by(key.desc(), Verification.id.desc())
+    return query.order_by(key.asc(), Verification.id.asc())
+
+class ReviewPage:
+    """One page of the review queue with the keyset cursors of its first and last rows"""
+
+    def __init__(self, order, rows, has_previous, has_next, pending_count=None):
+        self.order = order
+        self.rows = rows
+        self.has_previous = has_previous
+        self.has_next = has_next
+        self.pending_count = pending_count  # whole queue of the guild, if it was counted
+
+    @property
+    def first_cursor(self):
+        return (self.rows[0].sort_key, self.rows[0].id) if self.rows else None
+
+    @property
+    def last_cursor(self):
+        return (self.rows[-1].sort_key, self.rows[-1].id) if self.rows else None
+
+# Representative forms of the queries that run on every submission, review or
+# stats command, as session -> Query; check_query_plans asserts each one is
+# served by an index. Keep them in step with the methods they stand for.
+HOT_QUERIES = {
+    'review_page_oldest': lambda session: review_page_query(
+        session, 'oldest', (datetime.utcnow(), 0), guild_id='0'
+    ).limit(11),
+    'review_page_newest_back': lambda session: review_page_query(
+        session, 'newest', (datetime.utcnow(), 0), backwards=True, guild_id='0'
+    ).limit(11),
+    'review_page_liveness': lambda session: review_page_query(
+        session, 'liveness', (0.5, 0), guild_id='0'
+    ).limit(11),
+    'review_page_age': lambda session: review_page_query(session, 'age', (18.0, 0), guild_id='0').limit(11),
+    'review_page_without_guild': lambda session: review_page_query(session, 'oldest', (datetime.utcnow(), 0)).limit(11),
+    'pending_review_count': lambda session: pending_reviews_query(session, 'oldest', '0').with_entities(
+        func.count(Verification.id)
+    ),
+    'latest_verification': lambda session: session.query(Verification.id).filter_by(user_id='0').order_by(
+        Verification.submission_date.desc()
+    ).limit(1),
+    'user_verifications': lambda session: session.query(Verification.id).filter_by(user_id='0'),
+    'submitted_between': lambda session: session.query(Verification.id).filter(
+        Verification.submission_date >= datetime.utcnow() - timedelta(days=1),
+        Verification.submission_date < datetime.utcnow()
+    ),
+    'expired': lambda session: session.query(Verification.id).filter(
+        Verification.submission_date < datetime.utcnow()
+    ),
+    'media_references': lambda session: session.query(Verification.media_digest).filter(
+        Verification.media_digest.in_(['0' * 64])
+    ),
+    'daily_stats_range': lambda session: daily_stats_query(
+        session, '0', datetime.utcnow().date() - timedelta(days=6), datetime.utcnow().date()
+    ),
+    'pending_since': lambda session: session.query(func.count(Verification.id)).filter(
+        Verification.reviewed == False,
+        Verification.submission_date >= datetime.utcnow() - timedelta(days=1),
+        guild_verifications('0')
+    ),
+    'staff_reviews_since': lambda session: staff_review_stats_query(
+        session, datetime.utcnow() - timedelta(hours=24)
+    ),
+    'staff_reviews_guild': lambda session: staff_review_stats_query(session, guild_id='0'),
+    'age_histogram': lambda session: age_histogram_query(session, guild_id='0'),
+    'claimable_job': lambda session: session.query(VerificationJob.id).filter(or_(
+        and_(VerificationJob.status == 'queued', VerificationJob.available_at <= datetime.utcnow()),
+        and_(VerificationJob.status == 'running', VerificationJob.lease_expires < datetime.utcnow())
+    )).order_by(VerificationJob.id).limit(1),
+    'active_job': lambda session: session.query(VerificationJob.id).filter(
+        VerificationJob.user_id == '0', VerificationJob.status.in_(('queued', 'running'))
+    ),
+}
+
+# Hot queries that may sort or group the rows their index selected, e.g. the due
+# jobs, the day's reviews per reviewer or the bins of the age histogram
+SMALL_SORTS = {'claimable_job', 'staff_reviews_since', 'staff_reviews_guild', 'age_histogram'}
+
+def plan_uses_index(plan, allow_sort=False):
+    """Whether an EXPLAIN QUERY PLAN result only searches indexes, without full (index) scans or sorts
+
+    Scans of subquery results are fine; only scans of tables are flagged.
+    """
+    for detail in plan:
+        words = detail.split()
+        if words[0] == 'SCAN' and words[1] in Base.metadata.tables:
+            return False
+        if 'TEMP B-TREE' in detail and not allow_sort:
+            return False
+    return True
+
+class DatabaseStats:
+    """Unit-of-work counts, connection checkout waits and SQLite write-lock waits, in milliseconds"""
 
-class Database:
     def __init__(self):
-        self.engine = create_engine('sqlite:///verification_data.db')
+        self.reads = 0
+        self.writes = 0
+        self.checkout_ms = 0.0
+        self.max_checkout_ms = 0.0
+        self.lock_wait_ms = 0.0
+        self.max_lock_wait_ms = 0.0
+        self.lock_timeouts = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, elapsed_ms, write):
+        with self._lock:
+            if write:
+                self.writes += 1
+            else:
+                self.reads += 1
+            self.checkout_ms += elapsed_ms
+            self.max_checkout_ms = max(self.max_checkout_ms, elapsed_ms)
+
+    def record_lock_wait(self, elapsed_ms):
+        with self._lock:
+            self.lock_wait_ms += elapsed_ms
+            self.max_lock_wait_ms = max(self.max_lock_wait_ms, elapsed_ms)
+
+    def record_lock_timeout(self):
+        with self._lock:
+            self.lock_timeouts += 1
+
+# Connection pragmas for SQLite: WAL lets readers run alongside the writer, and with
+# synchronous=NORMAL a commit only syncs the WAL at checkpoints, not on every commit.
+# A power loss can lose the last commits but never corrupts the database.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative means KiB, so 64 MiB per connection
+    'temp_store': 'MEMORY',
+    'busy_timeout': 30000,
+    # Lets the retention purge hand freed pages back with PRAGMA incremental_vacuum;
+    # takes effect on new files, existing ones are converted by migration 4
+    'auto_vacuum': 'INCREMENTAL',
+}
+
+class WriteBehindBuffer:
+    """Collects non-critical inserts and writes them in one transaction every flush_ms or max_rows
+
+    For rows nobody reads back right away, such as audit entries and appeal
+    records: add() only appends to a list, and a background thread does the
+    writing. Rows of a failed flush are kept for the next one, up to
+    max_pending; past that the oldest are dropped with an error.
+    """
+
+    def __init__(self, database, flush_ms=500, max_rows=200, max_pending=10000):
+        self.database = database
+        self.flush_ms = flush_ms
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.dropped = 0
+        self._rows = []  # (model, values)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, model, **values):
+        """Queue one row for insertion"""
+        with self._lock:
+            self._rows.append((model, values))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.max_rows:
+                self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_ms / 1000)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write all queued rows in one transaction; returns the number written"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+
+        by_model = {}
+        for model, values in rows:
+            by_model.setdefault(model, []).append(values)
+        try:
+            with self.database._session(write=True) as session:
+                for model, mappings in by_model.items():
+                    session.bulk_insert_mappings(model, mappings)
+                session.commit()
+        except Exception as e:
+            logger.error(f"Write-behind flush of {len(rows)} rows failed: {e}")
+            with self._lock:
+                self._rows[:0] = rows
+                overflow = len(self._rows) - self.max_pending
+                if overflow > 0:
+                    del self._rows[:overflow]
+                    self.dropped += overflow
+                    logger.error(f"Write-behind buffer full, dropped {overflow} rows")
+            return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    def stop(self):
+        """Stop the background thread and write what is left"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+class Database:
+    """Data access for all cogs: one engine and pool, one short-lived session per unit of work
+
+    The bot creates a single instance and cogs share it as bot.db. Write
+    units start with BEGIN IMMEDIATE, so they wait for SQLite's write lock
+    up front, where the wait is measured, instead of failing halfway through.
+    """
+
+    def __init__(self, url='sqlite:///verification_data.db', pool_size=5, max_overflow=5,
+                 pool_timeout=30, busy_timeout=30, blob_root='media_store', pragmas=None,
+                 write_behind=None):
+        self.engine = create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            # Pooled connections move between the event loop and executor threads
+            connect_args={'timeout': busy_timeout, 'check_same_thread': False}
+        )
+        self.stats = DatabaseStats()
+        self.pragmas = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+        self.write_behind = WriteBehindBuffer(self, **(write_behind or {}))
+        # Submitted media lives on disk; verification rows keep only its digest and size
+        self.blobs = BlobStore(blob_root)
+        event.listen(self.engine, 'connect', self._on_connect)
+        event.listen(self.engine, 'begin', self._on_begin)
+
         Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        run_migrations(self.engine, Base.metadata)
+        # Results stay usable after their session is closed
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        # Let _on_begin issue BEGIN instead of the sqlite3 module
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    def _on_begin(self, connection):
+        mode = connection.info.get('begin_mode', 'DEFERRED')
+        start = time.perf_counter()
+        connection.exec_driver_sql(f"BEGIN {mode}")
+        if mode == 'IMMEDIATE':
+            self.stats.record_lock_wait((time.perf_counter() - start) * 1000)
+
+    @contextmanager
+    def _session(self, write=False):
+        """Session for one unit of work on its own pooled connection; rolled back unless committed"""
+        start = time.perf_counter()
+        connection = self.engine.connect()
+        self.stats.record_checkout((time.perf_counter() - start) * 1000, write)
+        # connection.info lives as long as the pooled connection, so always set the mode
+        connection.info['begin_mode'] = 'IMMEDIATE' if write else 'DEFERRED'
+        try:
+            with self.Session(bind=connection) as session:
+                yield session
+        except OperationalError as e:
+            if 'locked' in str(e):
+                self.stats.record_lock_timeout()
+            raise
+        finally:
+            connection.close()
+
+    def pool_stats(self):
+        """Connection pool, lock and write-behind statistics for status reporting"""
+        stats = self.stats
+        units = stats.reads + stats.writes
+        return {
+            'pool': self.engine.pool.status(),
+            'checked_out': self.engine.pool.checkedout(),
+            'reads': stats.reads,
+            'writes': stats.writes,
+            'mean_checkout_ms': stats.checkout_ms / units if units else 0.0,
+            'max_checkout_ms': stats.max_checkout_ms,
+            'mean_lock_wait_ms': stats.lock_wait_ms / stats.writes if stats.writes else 0.0,
+            'max_lock_wait_ms': stats.max_lock_wait_ms,
+            'lock_timeouts': stats.lock_timeouts,
+            'write_behind_pending': len(self.write_behind),
+            'write_behind_flushed': self.write_behind.flushed,
+            'write_behind_dropped': self.write_behind.dropped,
+        }
+
+    def query_plan(self, query):
+        """EXPLAIN QUERY PLAN details of a Query, one string per plan step"""
+        compiled = query.statement.compile(dialect=self.engine.dialect, compile_kwargs={'literal_binds': True})
+        with self.engine.connect() as connection:
+            return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}")]
 
-    def add_verification(self, user_id, username, media_data, media_type, estimated_age):
-        """Add a new verification entry"""
+    def check_query_plans(self):
+        """Return {name: plan} for every HOT_QUERIES entry that is not served by an index"""
+        failures = {}
+        with self._session() as session:
+            for name, build in HOT_QUERIES.items():
+                plan = self.query_plan(build(session))
+                if not plan_uses_index(plan, allow_sort=name in SMALL_SORTS):
+                    failures[name] = plan
+        for name, plan in failures.items():
+            logger.warning(f"Query {name} does not use an index: {'; '.join(plan)}")
+        return failures
+
+    def add_verification(self, user_id, username, media_data, media_type, estimated_age,
+                         face_descriptor=None, liveness_score=None, landmarks=None, guild_id=None):
+        """Add a new verification entry, storing its media in the blob store and counting it in daily_stats"""
+        now = datetime.utcnow()
+        # The blob is written first, outside the write lock; see _ensure_blob for the re-check
         verification = Verification(
             user_id=user_id,
             username=username,
-            media_data=media_data,
+            guild_id=guild_id,
+            submission_date=now,
+            media_digest=self.blobs.put(media_data),
+            media_size=len(media_data),
             media_type=media_type,
-            estimated_age=estimated_age
+            estimated_age=estimated_age,
+            face_descriptor=face_descriptor,
+            liveness_score=liveness_score,
+            landmarks=landmarks
+        )
+        with self._session(write=True) as session:
+            self._ensure_blob(session, verification.media_digest, media_data)
+            session.add(verification)
+            bump_daily_stats(session, guild_id, now.date(), submissions=1)
+            session.commit()
+            return verification.id
+
+    def open_media(self, verification):
+        """Binary file object with a verification's media, streamed from the blob store"""
+        if verification.media_digest:
+            return self.blobs.open(verification.media_digest)
+        # Not moved to the blob store yet
+        with self._session() as session:
+            return io.BytesIO(session.query(Verification.media_data).filter_by(id=verification.id).scalar())
+
+    def read_media(self, verification):
+        """A verification's whole media content"""
+        with self.open_media(verification) as f:
+            return f.read()
+
+    def move_media_to_blob_store(self, chunk_size=32):
+        """Move inline media of older rows into the blob store, chunk_size rows per transaction
+
+        Returns the number of rows moved. The freed pages are reused by SQLite
+        but the file only shrinks after a vacuum.
+        """
+        moved, after_id = 0, 0
+        while True:
+            with self._session() as session:
+                rows = session.query(Verification.id, Verification.media_data).filter(
+                    Verification.id > after_id,
+                    Verification.media_digest.is_(None)
+                ).order_by(Verification.id).limit(chunk_size).all()
+            if not rows:
+                break
+            # Blobs are written outside the transaction so the write lock is only held for the update
+            updates = [
+                {'id': row.id, 'media_digest': self.blobs.put(row.media_data),
+                 'media_size': len(row.media_data), 'media_data': b''}
+                for row in rows
+            ]
+            with self._session(write=True) as session:
+                for update, row in zip(updates, rows):
+                    self._ensure_blob(session, update['media_digest'], row.media_data)
+                session.bulk_update_mappings(Verification, updates)
+                session.commit()
+            moved += len(rows)
+            after_id = rows[-1].id
+        if moved:
+            logger.info(f"Moved the media of {moved} verifications to the blob store")
+        return moved
+
+    def _ensure_blob(self, session, digest, data):
+        """Take the write lock and store data again if a purge released its blob since it was put
+
+        Called in the transaction that adds a reference to digest. _release_media
+        only deletes while holding the write lock, so once this returns the
+        blob stays until the reference is committed and removed again.
+        """
+        session.connection()
+        if not self.blobs.exists(digest):
+            self.blobs.put(data)
+
+    def _release_media(self, digests):
+        """Delete blobs no verification refers to any more; returns the bytes freed
+
+        The reference check and the deletes hold the write lock, so they cannot
+        interleave with a writer adding a reference, see _ensure_blob.
+        """
+        digests = set(digests) - {None}
+        if not digests:
+            return 0
+        with self._session(write=True) as session:
+            referenced = {digest for digest, in session.query(Verification.media_digest).filter(
+                Verification.media_digest.in_(digests)
+            ).distinct()}
+            freed = sum(self.blobs.delete(digest) for digest in digests - referenced)
+            session.commit()
+        return freed
+
+    def add_audit_entry(self, action, user_id=None, actor_id=None, details=None):
+        """Record an audit log entry; written behind, within write_behind.flush_ms"""
+        self.write_behind.add(
+            AuditEntry,
+            created_at=datetime.utcnow(),
+            action=action,
+            user_id=user_id,
+            actor_id=actor_id,
+            details=details
         )
-        self.session.add(verification)
-        self.session.commit()
-        return verification.id
 
-    def get_pending_reviews(self):
-        """Get all unreviewed verifications"""
-        return self.session.query(Verification).filter_by(reviewed=False).all()
+    def add_appeal(self, user_id, appeal_msg_id, reason, claimed_age=None, proof=None, reconsideration=None):
+        """Record a submitted appeal; written behind, as staff work from the appeals channel message"""
+        self.write_behind.add(
+            Appeal,
+            created_at=datetime.utcnow(),
+            user_id=user_id,
+            appeal_msg_id=appeal_msg_id,
+            reason=reason,
+            claimed_age=claimed_age,
+            proof=proof or None,
+            reconsideration=reconsideration,
+            status='pending'
+        )
+
+    def close(self):
+        """Write out buffered rows and close the pooled connections"""
+        self.write_behind.stop()
+        self.engine.dispose()
+
+    def get_review_page(self, guild_id, order='oldest', cursor=None, backwards=False, limit=10,
+                        count_pending=False):
+        """One ReviewPage of a guild's queue: each user's latest unreviewed submission in REVIEW_ORDERS order
+
+        The queue holds the guild's submissions and those without a guild.
+        cursor is a page's last_cursor to get the next page, or with backwards
+        its first_cursor to get the previous one. Each of the two parts is an
+        index range read, so a page's cost does not grow with the backlog.
+        count_pending also counts the whole queue into pending_count, which
+        does grow with it, so callers count once and not on every page turn.
+        """
+        key, descending = REVIEW_ORDERS[order]
+        with self._session() as session:
+            rows = []
+            pending = 0 if count_pending else None
+            for guild in (guild_id, None):
+                rows += review_page_query(session, order, cursor, backwards, guild).limit(limit + 1).all()
+                if count_pending:
+                    pending += pending_reviews_query(session, order, guild).with_entities(
+                        func.count(Verification.id)
+                    ).scalar()
+        rows.sort(key=lambda row: (row.sort_key, row.id), reverse=descending != backwards)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:
+            rows.reverse()
+            return ReviewPage(order, rows, has_previous=more, has_next=True, pending_count=pending)
+        return ReviewPage(order, rows, has_previous=cursor is not None, has_next=more, pending_count=pending)
+
+    def get_daily_stats(self, guild_id, start, end):
+        """Counters of a guild for each UTC day from start to end inclusive, oldest first, zero-filled"""
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        with self._session() as session:
+            rows = daily_stats_query(session, guild_id, start, end).all()
+        return list(merge_daily_stats(rows, days).values())
+
+    def get_todays_stats(self, guild_id):
+        """Today's submissions, approvals and rejections, and how many of today's submissions await review"""
+        now = datetime.utcnow()
+        today = self.get_daily_stats(guild_id, now.date(), now.date())[0]
+        with self._session() as session:
+            today['pending'] = session.query(func.count(Verification.id)).filter(
+                Verification.reviewed == False,
+                Verification.submission_date >= datetime.combine(now.date(), datetime.min.time()),
+                guild_verifications(guild_id)
+            ).scalar()
+        return today
+
+    def get_average_processing_time(self, guild_id, days=30):
+        """Mean minutes from submission to review over the last days, 0.0 without reviews"""
+        today = datetime.utcnow().date()
+        return mean_processing_minutes(self.get_daily_stats(guild_id, today - timedelta(days=days - 1), today))
+
+    def get_verification_trends(self, guild_id, days=30):
+        """(day, submissions) for each of the last days"""
+        today = datetime.utcnow().date()
+        return [
+            (day['day'], day['submissions'])
+            for day in self.get_daily_stats(guild_id, today - timedelta(days=days - 1), today)
+        ]
+
+    def export_verification_stats(self, guild_id):
+        """Every day with activity as a dict of date, counters and mean processing minutes, oldest first"""
+        with self._session() as session:
+            rows = daily_stats_query(session, guild_id).all()
+        return [
+            {
+                'date': day.isoformat(),
+                'submissions': stats['submissions'],
+                'approvals': stats['approvals'],
+                'rejections': stats['rejections'],
+                'avg_time': round(mean_processing_minutes([stats]), 1),
+            }
+            for day, stats in merge_daily_stats(rows).items()
+        ]
+
+    def get_advanced_stats(self, guild_id, days=30):
+        """Peak submission hours, mean processing minutes and approval rate over the last days"""
+        now = datetime.utcnow()
+        stats = self.get_daily_stats(guild_id, now.date() - timedelta(days=days - 1), now.date())
+        approvals = sum(day['approvals'] for day in stats)
+        decisions = approvals + sum(day['rejections'] for day in stats)
+
+        # The rollup is per day, so hours come from a grouped read of the window's submissions
+        hour = func.strftime('%H', Verification.submission_date)
+        with self._session() as session:
+            peaks = session.query(hour, func.count(Verification.id)).filter(
+                Verification.submission_date >= now - timedelta(days=days),
+                guild_verifications(guild_id)
+            ).group_by(hour).order_by(func.count(Verification.id).desc()).limit(3).all()
+        return {
+            'peak_hours': ", ".join(f"{h}:00" for h, _ in peaks) + " UTC" if peaks else "No submissions",
+            'avg_processing_time': mean_processing_minutes(stats),
+            'approval_rate': approvals / decisions * 100 if decisions else 0.0,
+        }
+
+    def get_staff_review_stats(self, since=None, min_age=13, guild_id=None):
+        """{reviewer_id: review counts, approval rate and latency in minutes}, from one grouped query
+
+        since limits it to reviews from then on and guild_id to the reviews of
+        that guild's queue. agreed counts the decisions that match the age
+        estimate: approving at min_age or over, rejecting under it.
+        """
+        with self._session() as session:
+            rows = staff_review_stats_query(session, since, min_age, guild_id).all()
+        return {
+            row.reviewer_id: {
+                'total': row.total,
+                'approvals': row.approvals,
+                'rejections': row.total - row.approvals,
+                'approval_rate': row.approvals / row.total * 100,
+                'agreed': row.agreed,
+                'avg_time': row.avg_time,
+                'p50_time': row.p50_time,
+                'p90_time': row.p90_time,
+            }
+            for row in rows
+        }
+
+    def get_age_distribution(self, bin_years=2, guild_id=None):
+        """(bin start, count) of verified members' estimated ages in bin_years wide bins, youngest first"""
+        with self._session() as session:
+            return [(row.bin_start, row.count) for row in age_histogram_query(session, bin_years, guild_id)]
+
+    def rebuild_daily_stats(self):
+        """Recompute daily_stats from the verifications table; returns the number of rows written
+
+        Verifications removed by the retention purge are no longer counted, so
+        this is for repairing the rollup rather than routine use.
+        """
+        with self._session(write=True) as session:
+            written = backfill_daily_stats(session.connection(), Base.metadata)
+            session.commit()
+        return written
+
+    def get_latest_verification(self, user_id):
+        """Get the most recent verification entry of a user"""
+        with self._session() as session:
+            return session.query(Verification).filter_by(user_id=user_id).order_by(
+                Verification.submission_date.desc()
+            ).first()
 
     def get_verification(self, verification_id):
         """Get a specific verification entry"""
-        return self.session.query(Verification).filter_by(id=verification_id).first()
+        with self._session() as session:
+            return session.query(Verification).filter_by(id=verification_id).first()
 
     def update_review(self, verification_id, reviewer_id, verified, notes=None):
-        """Update verification review status"""
-        verification = self.get_verification(verification_id)
-        if verification:
-            verification.reviewed = True
-            verification.reviewer_id = reviewer_id
-            verification.verified = verified
-            verification.review_date = datetime.utcnow()
-            verification.review_notes = notes
-            self.session.commit()
-            return True
-        return False
+        """Update verification review status and count the decision in daily_stats"""
+        with self._session(write=True) as session:
+            verification = session.query(Verification).filter_by(id=verification_id).first()
+            if verification:
+                if verification.reviewed and verification.review_date:
+                    # A changed decision replaces the earlier one in the stats
+                    count_review(session, verification, -1)
+                verification.reviewed = True
+                verification.reviewer_id = reviewer_id
+                verification.verified = verified
+                verification.review_date = datetime.utcnow()
+                verification.review_notes = notes
+                count_review(session, verification)
+                session.commit()
+                self.add_audit_entry(
+                    'verification_reviewed', verification.user_id, reviewer_id,
+                    'approved' if verified else 'rejected'
+                )
+                return True
+            return False
 
     def get_user_verifications(self, user_id):
         """Get all verifications for a specific user"""
-        return self.session.query(Verification).filter_by(user_id=user_id).all()
-
-    def cleanup_old_verifications(self, days=30):
-        """Remove verification entries older than specified days"""
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        self.session.query(Verification).filter(
-            Verification.submission_date < cutoff_date,
-            Verification.reviewed == True
-        ).delete()
-        self.session.commit()
+        with self._session() as session:
+            return session.query(Verification).filter_by(user_id=user_id).all()
+
+    def add_ban(self, user_id, guild_id):
+        """Record that a guild banned a user"""
+        with self._session(write=True) as session:
+            session.execute(sqlite_insert(BannedUser).values(
+                user_id=user_id, guild_id=guild_id, banned_at=datetime.utcnow()
+            ).on_conflict_do_nothing())
+            session.commit()
+
+    def remove_ban(self, user_id, guild_id):
+        """Forget a guild's ban of a user; returns whether another guild still bans them"""
+        with self._session(write=True) as session:
+            session.query(BannedUser).filter_by(user_id=user_id, guild_id=guild_id).delete()
+            still_banned = session.query(exists().where(BannedUser.user_id == user_id)).scalar()
+            session.commit()
+            return still_banned
+
+    def get_face_descriptors(self):
+        """Get (user_id, face_descriptor, banned) for every verification with a descriptor
+
+        A user counts as banned when a guild banned them or a review rejected them.
+        """
+        banned = exists().where(BannedUser.user_id == Verification.user_id)
+        with self._session() as session:
+            rows = session.query(
+                Verification.user_id,
+                Verification.face_descriptor,
+                or_(Verification.reviewed & ~Verification.verified, banned)
+            ).filter(Verification.face_descriptor.isnot(None))
+            return [(user_id, descriptor, bool(is_banned)) for user_id, descriptor, is_banned in rows]
+
+    def iter_landmark_chunks(self, after_id=0, chunk_size=1000):
+        """Yield lists of (id, estimated_age, landmarks) rows with stored landmarks in id order
+
+        Like iter_verification_chunks, each chunk is a keyset query on id in its
+        own session, so only one chunk of landmark blobs is in memory at a time.
+        """
+        while True:
+            with self._session() as session:
+                chunk = session.query(
+                    Verification.id,
+                    Verification.estimated_age,
+                    Verification.landmarks
+                ).filter(
+                    Verification.id > after_id,
+                    Verification.landmarks.isnot(None)
+                ).order_by(Verification.id).limit(chunk_size).all()
+            if not chunk:
+                return
+            after_id = chunk[-1].id
+            yield chunk
+
+    def update_estimated_ages(self, ages):
+        """Overwrite estimated ages from a {verification_id: age} mapping in one transaction"""
+        with self._session(write=True) as session:
+            session.bulk_update_mappings(Verification, [
+                {'id': verification_id, 'estimated_age': age} for verification_id, age in ages.items()
+            ])
+            session.commit()
+
+    def iter_verification_chunks(self, after_id=0, chunk_size=64):
+        """Yield lists of (id, user_id, media_type, media_digest, media_size, estimated_age) rows in id order
+
+        Each chunk is a keyset query on id in its own session; the media itself
+        is read from the blob store with read_media when it is needed.
+        """
+        while True:
+            with self._session() as session:
+                chunk = session.query(
+                    Verification.id,
+                    Verification.user_id,
+                    Verification.media_type,
+                    Verification.media_digest,
+                    Verification.media_size,
+                    Verification.estimated_age
+                ).filter(Verification.id > after_id).order_by(Verification.id).limit(chunk_size).all()
+            if not chunk:
+                return
+            after_id = chunk[-1].id
+            yield chunk
+
+    def enqueue_job(self, user_id, username, filename, media_type, media_data):
+        """Store a submission in the job queue and return the job id"""
+        job = VerificationJob(
+            user_id=user_id,
+            username=username,
+            filename=filename,
+            media_type=media_type,
+            media_data=media_data
+        )
+        with self._session(write=True) as session:
+            session.add(job)
+            session.commit()
+            return job.id
+
+    def get_active_job(self, user_id):
+        """(id, status) of a user's queued or running job, if any; the media is not loaded"""
+        with self._session() as session:
+            return session.query(VerificationJob.id, VerificationJob.status).filter(
+                VerificationJob.user_id == user_id,
+                VerificationJob.status.in_(('queued', 'running'))
+            ).first()
+
+    def queue_position(self, job_id):
+        """1-based position of a job among the unfinished ones"""
+        with self._session() as session:
+            return session.query(func.count(VerificationJob.id)).filter(
+                VerificationJob.id <= job_id,
+                VerificationJob.status.in_(('queued', 'running'))
+            ).scalar()
+
+    def claim_job(self, lease_seconds):
+        """Lease the oldest job that is due, or one whose lease expired; returns it or None
+
+        The job is picked and leased inside one write transaction, so it is
+        only handed to one worker even when several bot processes share the database.
+        """
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(VerificationJob.status == 'queued', VerificationJob.available_at <= now),
+            and_(VerificationJob.status == 'running', VerificationJob.lease_expires < now)
+        )
+        with self._session(write=True) as session:
+            job = session.query(VerificationJob).filter(claimable).order_by(
+                VerificationJob.id
+            ).limit(1).first()
+            if job is None:
+                return None
+            job.status = 'running'
+            job.attempts += 1
+            job.lease_expires = now + timedelta(seconds=lease_seconds)
+            session.commit()
+            return job
+
+    def finish_job(self, job_id, error=None):
+        """Mark a job done (or failed, with error) and drop its media copy"""
+        with self._session(write=True) as session:
+            session.query(VerificationJob).filter_by(id=job_id).update({
+                'status': 'failed' if error else 'done',
+                'media_data': None,
+                'lease_expires': None,
+                'finished_at': datetime.utcnow(),
+                'last_error': error
+            }, synchronize_session=False)
+            session.commit()
+
+    def retry_job(self, job_id, error, delay_seconds):
+        """Put a job back in the queue, not to be claimed for delay_seconds"""
+        with self._session(write=True) as session:
+            session.query(VerificationJob).filter_by(id=job_id).update({
+                'status': 'queued',
+                'lease_expires': None,
+                'available_at': datetime.utcnow() + timedelta(seconds=delay_seconds),
+                'last_error': error
+            }, synchronize_session=False)
+            session.commit()
+
+    def queue_depth(self):
+        """Number of jobs per status"""
+        with self._session() as session:
+            rows = session.query(VerificationJob.status, func.count(VerificationJob.id)).group_by(
+                VerificationJob.status
+            )
+            return {status: count for status, count in rows}
+
+    def purge_expired_media(self, cutoff, after_id=0, batch_size=200):
+        """Drop the media of up to batch_size verifications submitted before cutoff
+
+        Unreviewed submissions are included, so the retention period holds even
+        for ones staff never got to. The rows stay for statistics. Returns (last id handled or None when
+        done, rows, blob bytes freed); pass the last id back for the next batch.
+        """
+        expired = and_(
+            Verification.submission_date < cutoff,
+            Verification.media_digest.isnot(None),
+            Verification.id > after_id
+        )
+        with self._session(write=True) as session:
+            rows = session.query(Verification.id, Verification.media_digest).filter(expired).order_by(
+                Verification.id
+            ).limit(batch_size).all()
+            if not rows:
+                return None, 0, 0
+            session.query(Verification).filter(
+                Verification.id.between(rows[0].id, rows[-1].id), expired
+            ).update({'media_digest': None, 'media_size': None, 'media_data': b''}, synchronize_session=False)
+            session.commit()
+        # Blobs are deleted after the commit, outside the write lock
+        return rows[-1].id, len(rows), self._release_media(row.media_digest for row in rows)
+
+    def _delete_batch(self, table, expired, batch_size, *columns):
+        """Delete the first batch_size expired rows of table by id range; returns their (id, *columns)"""
+        with self._session(write=True) as session:
+            rows = session.query(table.id, *columns).filter(expired).order_by(table.id).limit(batch_size).all()
+            if rows:
+                session.query(table).filter(table.id.between(rows[0].id, rows[-1].id), expired).delete(
+                    synchronize_session=False
+                )
+                session.commit()
+            return rows
+
+    def purge_expired_verifications(self, cutoff, after_id=0, batch_size=200):
+        """Delete up to batch_size verifications submitted before cutoff, reviewed or not, with their media
+
+        Returns (last id handled or None when done, rows, blob bytes freed).
+        """
+        rows = self._delete_batch(Verification, and_(
+            Verification.submission_date < cutoff,
+            Verification.id > after_id
+        ), batch_size, Verification.media_digest)
+        if not rows:
+            return None, 0, 0
+        return rows[-1].id, len(rows), self._release_media(row.media_digest for row in rows)
+
+    def purge_finished_jobs(self, cutoff, after_id=0, batch_size=200):
+        """Delete up to batch_size jobs finished before cutoff; returns (last id or None when done, rows)"""
+        rows = self._delete_batch(VerificationJob, and_(
+            VerificationJob.status.in_(('done', 'failed')),
+            VerificationJob.finished_at < cutoff,
+            VerificationJob.id > after_id
+        ), batch_size)
+        return (rows[-1].id if rows else None), len(rows)
+
+    def purge_audit_entries(self, cutoff, after_id=0, batch_size=200):
+        """Delete up to batch_size audit entries from before cutoff; returns (last id or None when done, rows)"""
+        rows = self._delete_batch(AuditEntry, and_(
+            AuditEntry.created_at < cutoff,
+            AuditEntry.id > after_id
+        ), batch_size)
+        return (rows[-1].id if rows else None), len(rows)
+
+    def reclaim_space(self, max_pages=1000):
+        """Return up to max_pages free pages to the file system; returns (bytes reclaimed, free pages left)"""
+        with self._session(write=True) as session:
+            connection = session.connection()
+            page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+            free_before = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+            # Each step of the pragma frees one page, and the driver steps a statement
+            # without result columns only once per execute; closing the cursor resets it
+            cursor = connection.connection.cursor()
+            for _ in range(min(int(max_pages), free_before)):
+                cursor.execute('PRAGMA incremental_vacuum')
+            cursor.close()
+            free_after = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+            session.commit()
+        return (free_before - free_after) * page_size, free_after
+
+
+class AsyncDatabase:
+    """Coroutine versions of every Database method, run on dedicated database threads
+
+    Calls go through a work queue to a small thread pool of their own, so a
+    slow commit or a wait for SQLite's write lock blocks a database thread
+    instead of the event loop, and never takes a slot of the default executor
+    used for inference bookkeeping. Code that already runs off the event loop
+    uses the wrapped Database directly as .sync.
+    """
+
+    def __init__(self, database, threads=4):
+        self.sync = database
+        self.threads = threads
+        self.pending = 0  # calls queued or running; only touched on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='database')
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+        if name.startswith('_') or not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            self.pending += 1
+            try:
+                return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    async def pool_stats(self):
+        """Database.pool_stats plus the number of calls waiting for a database thread"""
+        stats = self.sync.pool_stats()
+        stats['pending_calls'] = self.pending
+        stats['threads'] = self.threads
+        return stats
+
+    def close(self):
+        """Finish queued calls, then close the pooled connections"""
+        self._executor.shutdown(wait=True)
+        self.sync.close()
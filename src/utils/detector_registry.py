@@ -0,0 +1,54 @@
+import json
+import logging
+import threading
+
+from src.utils.face_detection import FaceDetector
+
+logger = logging.getLogger('age-verify-bot')
+
+
+class DetectorRegistry:
+    """Process-wide FaceDetector instances, shared by every caller with the same options"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._detectors = {}
+
+    @staticmethod
+    def _key(options):
+        # Options can hold nested config sections, so key on their canonical JSON
+        return json.dumps(options, sort_keys=True)
+
+    def get(self, **options):
+        """Return the shared detector for these options; its graphs load on first use"""
+        key = self._key(options)
+        with self._lock:
+            detector = self._detectors.get(key)
+            if detector is None:
+                detector = FaceDetector(**options)
+                self._detectors[key] = detector
+            return detector
+
+    def warm_up(self, **options):
+        """Load and warm the shared detector, returning its load statistics"""
+        detector = self.get(**options)
+        if detector.warm_up_seconds is None:
+            detector.warm_up()
+            stats = detector.stats()
+            message = (
+                f"Face detector ready: load {stats['load_seconds']:.2f}s, "
+                f"warm-up {stats['warm_up_seconds']:.2f}s"
+            )
+            if stats['graph_memory_bytes'] is not None:
+                message += f", graph memory {stats['graph_memory_bytes'] / 2**20:.1f} MiB"
+            logger.info(message)
+        return detector.stats()
+
+
+# Shared by everything in this process
+registry = DetectorRegistry()
+
+
+def get_detector(**options):
+    """Return the process-wide FaceDetector for these options"""
+    return registry.get(**options)
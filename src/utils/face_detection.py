@@ -1,27 +1,164 @@
 import cv2
-import mediapipe as mp
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageSequence
 import io
 import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from src.utils.landmark_store import pack_landmarks, stack_landmarks
+from src.utils.media_probe import ProbeError, probe_header
+from src.utils.spoof_cascade import CheckContext, SpoofCascade
+
 logger = logging.getLogger('age-verify-bot')
 
-class FaceDetector:
+def current_rss_bytes():
+    """Resident memory of this process in bytes, or None where it cannot be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Face mesh landmark indices used for the facial proportion ratio
+LEFT_EYE = [33, 133]
+RIGHT_EYE = [362, 263]
+NOSE_BRIDGE = 168
+CHIN = 152
+RATIO_LANDMARKS = LEFT_EYE + RIGHT_EYE + [NOSE_BRIDGE, CHIN]
+
+# Uniform subsample of the 468 mesh landmarks used for the face descriptor
+DESCRIPTOR_LANDMARKS = np.arange(0, 468, 4)
+
+class StageTimer:
+    """Collects wall-clock time spent in each named pipeline stage, in milliseconds"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+class StageLatency:
+    """Run count and latency of one pipeline stage"""
+
+    def __init__(self):
+        self.runs = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.runs if self.runs else 0.0
+
+    def record(self, elapsed_ms):
+        self.runs += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+class StageStats:
+    """Per-stage latency, aggregated from the StageTimer timings of analysis results"""
+
+    def __init__(self):
+        self.stages = {}  # media type -> {stage name -> StageLatency}, plus 'total' per analysis
+
+    def record(self, media_type, timings):
+        """Add one analysis' {stage name: milliseconds} timings"""
+        if not timings:
+            return
+        stages = self.stages.setdefault(media_type, {})
+        for name, elapsed_ms in timings.items():
+            stages.setdefault(name, StageLatency()).record(elapsed_ms)
+        stages.setdefault('total', StageLatency()).record(sum(timings.values()))
+
+class AnalysisResult:
+    """Outcome of a single FaceDetector.analyze pass over one image"""
+
     def __init__(self):
-        # Initialize MediaPipe Face Detection
-        self.mp_face_detection = mp.solutions.face_detection
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_detection = self.mp_face_detection.FaceDetection(
-            model_selection=1,  # 1 for far faces, 0 for near faces
-            min_detection_confidence=0.5
-        )
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
-            min_detection_confidence=0.5
-        )
+        self.is_spoof = False
+        self.reason = None
+        self.error = None
+        self.transient = False  # analysis could not run (timeout, crashed worker); retrying may succeed
+        self.detections = []  # (xmin, ymin, width, height, score), relative to the image
+        self.landmarks = None  # (468, 2) float32 array of relative mesh coordinates
+        self.face_ratio = None
+        self.estimated_age = None
+        self.checks = []  # (check name, rejection reason or None, milliseconds) per cascade step
+        self.descriptor = None  # normalized landmark geometry, see FaceDetector.face_descriptor
+        self.frames_analyzed = 1  # sampled frames of an animated GIF/APNG that were analysed
+        self.static_animation = False  # animated image whose frames are all the same picture
+        self.liveness = None  # 0..1 non-rigid face motion across video frames, see FaceDetector.analyze_video
+        self.packed_landmarks = None  # landmarks of the frames behind the estimate, see landmark_store
+        self.timings = {}  # stage name -> milliseconds
+
+    def reject(self, reason):
+        """Mark the submission as a spoof attempt"""
+        self.is_spoof = True
+        self.reason = reason
+        return self
+
+class FaceDetector:
+    def __init__(self, max_image_side=1280, crop_margin=0.3, video_sample_interval=0.5,
+                 video_max_samples=12, video_max_pixels=200_000_000, video_consensus=3,
+                 max_decode_pixels=40_000_000, animation_max_frames=24,
+                 animation_max_pixels=100_000_000, animation_static_frames=4,
+                 animation_static_threshold=2.0, liveness_side=160, liveness_reference=0.02,
+                 liveness_min_pairs=6, spoof_cascade=None):
+        # Uploads are decoded no larger than this; the models work at far lower resolutions anyway
+        self.max_image_side = max_image_side
+        # Images whose header claims more pixels than this are never decoded
+        self.max_decode_pixels = max_decode_pixels
+        # Padding around the detected face box, relative to the box size, for the mesh crop
+        self.crop_margin = crop_margin
+
+        # Video sampling: one frame every video_sample_interval seconds, at most
+        # video_max_samples frames and video_max_pixels decoded pixels per video,
+        # stopping early once video_consensus samples agree on an estimate
+        self.video_sample_interval = video_sample_interval
+        self.video_max_samples = video_max_samples
+        self.video_max_pixels = video_max_pixels
+        self.video_consensus = video_consensus
+
+        # Animated GIF/APNG frames are sampled on the same time grid as video, within
+        # their own frame and pixel budgets. Sampling stops once animation_static_frames
+        # samples in a row differ from the previous one by at most
+        # animation_static_threshold grey levels on average: a still photo sent as an animation
+        self.animation_max_frames = animation_max_frames
+        self.animation_max_pixels = animation_max_pixels
+        self.animation_static_frames = animation_static_frames
+        self.animation_static_threshold = animation_static_threshold
+
+        # Liveness: face motion is tracked on grayscale frames of liveness_side pixels.
+        # Each pair of sampled frames gives the median non-rigid displacement of the
+        # tracked points; a mean over the pairs of liveness_reference face widths scores 1.0.
+        # Sampling continues past the video_consensus stop until liveness_min_pairs pairs
+        # are tracked, as a second or so of motion cannot tell a replayed still from a face
+        self.liveness_side = liveness_side
+        self.liveness_reference = liveness_reference
+        self.liveness_min_pairs = liveness_min_pairs
+
+        # Quality and spoof checks, run cheapest first; see spoof_cascade.py
+        cascade_options = dict(spoof_cascade or {})
+        self.cascade_gray_side = cascade_options.pop('gray_side', 640)
+        self.cascade = SpoofCascade.from_config(cascade_options)
+
+        # MediaPipe graphs are created on first use, see _load_graphs
+        self._face_detection = None
+        self._face_mesh = None
+        self._graph_lock = threading.Lock()
+        self.load_seconds = None
+        self.graph_memory_bytes = None
+        self.warm_up_seconds = None
 
         # Age estimation parameters
         self.age_ranges = {
@@ -30,38 +167,138 @@ class FaceDetector:
             'adult': {'ratio_range': (0.95, 1.1), 'estimated_age': 20}
         }
 
-    def _calculate_face_features(self, face_landmarks, image_shape):
-        """Calculate facial features for age estimation"""
-        try:
-            if not face_landmarks.multi_face_landmarks:
-                return None
+    def _load_graphs(self):
+        """Import MediaPipe and build both graphs, recording load time and memory"""
+        with self._graph_lock:
+            if self._face_mesh is not None:
+                return
+
+            start = time.perf_counter()
+            rss_before = current_rss_bytes()
+
+            import mediapipe as mp
+
+            # Initialize MediaPipe Face Detection
+            self.mp_face_detection = mp.solutions.face_detection
+            self.mp_face_mesh = mp.solutions.face_mesh
+            self._face_detection = self.mp_face_detection.FaceDetection(
+                model_selection=1,  # 1 for far faces, 0 for near faces
+                min_detection_confidence=0.5
+            )
+            self._face_mesh = self.mp_face_mesh.FaceMesh(
+                static_image_mode=True,
+                max_num_faces=1,
+                min_detection_confidence=0.5
+            )
+
+            self.load_seconds = time.perf_counter() - start
+            rss_after = current_rss_bytes()
+            if rss_before is not None and rss_after is not None:
+                self.graph_memory_bytes = rss_after - rss_before
+            logger.info(f"Loaded MediaPipe graphs in {self.load_seconds:.2f}s")
+
+    @property
+    def face_detection(self):
+        if self._face_mesh is None:
+            self._load_graphs()
+        return self._face_detection
+
+    @property
+    def face_mesh(self):
+        if self._face_mesh is None:
+            self._load_graphs()
+        return self._face_mesh
+
+    @property
+    def graphs_loaded(self):
+        return self._face_mesh is not None
+
+    def warm_up(self):
+        """Run both MediaPipe graphs once so the first real request is not slowed down"""
+        if not self.graphs_loaded:
+            self._load_graphs()
+
+        start = time.perf_counter()
+        frame = np.zeros((256, 256, 3), dtype=np.uint8)
+        self.face_detection.process(frame)
+        self.face_mesh.process(frame)
+        self.warm_up_seconds = time.perf_counter() - start
+
+    def stats(self):
+        """Model load statistics for status reporting"""
+        return {
+            'loaded': self.graphs_loaded,
+            'load_seconds': self.load_seconds,
+            'warm_up_seconds': self.warm_up_seconds,
+            'graph_memory_bytes': self.graph_memory_bytes
+        }
 
-            landmarks = face_landmarks.multi_face_landmarks[0].landmark
-            image_height, image_width = image_shape[:2]
+    def _landmark_array(self, face_landmarks):
+        """Convert the first face of a FaceMesh result into a (468, 2) array of relative coordinates"""
+        landmarks = face_landmarks.multi_face_landmarks[0].landmark
+        return np.array([(point.x, point.y) for point in landmarks], dtype=np.float32)
+
+    def _calculate_face_ratios(self, landmarks, image_sizes):
+        """Calculate the eye distance / face height ratio for a batch of faces
+
+        landmarks is an (N, 468, 2) array of relative mesh coordinates and
+        image_sizes an (N, 2) array of (width, height) pixel sizes.
+        """
+        # Convert the six landmarks used to pixel coordinates, truncated like int() did per point
+        coords = np.trunc(landmarks[:, RATIO_LANDMARKS] * image_sizes[:, None, :])
+
+        # Eyes distance (horizontal)
+        left_eye = coords[:, 0:2].mean(axis=1)
+        right_eye = coords[:, 2:4].mean(axis=1)
+        eye_distance = np.linalg.norm(left_eye - right_eye, axis=1)
+
+        # Face height (vertical)
+        face_height = np.linalg.norm(coords[:, 4] - coords[:, 5], axis=1)
+
+        ratios = np.zeros(len(coords))
+        np.divide(eye_distance, face_height, out=ratios, where=face_height > 0)
+        return ratios
+
+    def face_descriptor(self, landmarks, image_shape):
+        """Pose-normalized landmark geometry used to recognise the same face across accounts
+
+        Landmarks are moved to pixel space, centred between the eyes, rotated so
+        the eye line is horizontal and scaled so the eyes are one unit apart.
+        """
+        image_height, image_width = image_shape[:2]
+        points = landmarks.astype(np.float64) * (image_width, image_height)
+
+        left_eye = points[LEFT_EYE].mean(axis=0)
+        right_eye = points[RIGHT_EYE].mean(axis=0)
+        eye_vector = right_eye - left_eye
+        eye_distance = np.linalg.norm(eye_vector)
+        if eye_distance == 0:
+            return None
 
-            # Convert landmarks to pixel coordinates
-            coords = [(int(point.x * image_width), int(point.y * image_height)) 
-                     for point in landmarks]
+        angle = np.arctan2(eye_vector[1], eye_vector[0])
+        cos, sin = np.cos(-angle), np.sin(-angle)
+        rotation = np.array([[cos, -sin], [sin, cos]])
 
-            # Calculate key facial measurements
-            # Eyes distance (horizontal)
-            left_eye = np.mean([coords[33], coords[133]], axis=0)  # Left eye center
-            right_eye = np.mean([coords[362], coords[263]], axis=0)  # Right eye center
-            eye_distance = np.linalg.norm(left_eye - right_eye)
+        centred = points[DESCRIPTOR_LANDMARKS] - (left_eye + right_eye) / 2
+        return (centred @ rotation.T / eye_distance).astype(np.float32).ravel()
 
-            # Face height (vertical)
-            nose_bridge = coords[168]  # Nose bridge point
-            chin = coords[152]  # Chin point
-            face_height = np.linalg.norm(np.array(nose_bridge) - np.array(chin))
+    def _estimate_ages_from_ratios(self, ratios):
+        """Vectorized _estimate_age_from_ratio; NaN ratios give NaN ages"""
+        ratios = np.asarray(ratios, dtype=np.float64)
 
-            # Calculate ratio
-            face_ratio = eye_distance / face_height if face_height > 0 else 0
+        # Default to adult if ratio is unclear
+        ages = np.full(ratios.shape, 20.0)
+        unmatched = ~np.isnan(ratios)
+        ages[~unmatched] = np.nan
 
-            return face_ratio
+        # First matching range wins, as in the scalar version
+        for params in self.age_ranges.values():
+            min_ratio, max_ratio = params['ratio_range']
+            matched = unmatched & (ratios >= min_ratio) & (ratios <= max_ratio)
+            ages[matched] = params['estimated_age']
+            unmatched &= ~matched
 
-        except Exception as e:
-            logger.error(f"Error calculating face features: {e}")
-            return None
+        return ages
 
     def _estimate_age_from_ratio(self, ratio):
         """Estimate age based on facial proportions"""
@@ -79,15 +316,203 @@ class FaceDetector:
 
         return estimated_age
 
+    def rescore_landmarks(self, blobs):
+        """Re-estimate ages from packed landmark blobs with the current age rules, without any decoding
+
+        Multi-frame blobs (video) get the median of their frames, like
+        analyze_video. Returns a float array with NaN where no age results.
+        """
+        frames, sizes, owners = stack_landmarks(blobs)
+        ages = np.full(len(blobs), np.nan)
+        if not len(frames):
+            return ages
+
+        frame_ages = self._estimate_ages_from_ratios(self._calculate_face_ratios(frames, sizes))
+        # Frames are grouped by owner in blob order; blobs with the same frame
+        # count are reshaped into one (blobs, frames) matrix for the median
+        counts = np.bincount(owners, minlength=len(blobs))
+        starts = np.cumsum(counts) - counts
+        for count in np.unique(counts[counts > 0]):
+            owned = np.flatnonzero(counts == count)
+            grouped = frame_ages[starts[owned][:, None] + np.arange(count)]
+            scored = ~np.isnan(grouped).all(axis=1)
+            ages[owned[scored]] = np.nanmedian(grouped[scored], axis=1)
+        return ages
+
+    def _image_size(self, image_data):
+        """(width, height) read from the image header without decoding pixels, or None"""
+        try:
+            info = probe_header(image_data)
+            if info.pixels:
+                return info.width, info.height
+        except ProbeError:
+            pass
+        try:
+            with Image.open(io.BytesIO(image_data)) as probe:
+                return probe.size
+        except Exception:
+            return None
+
+    def _reduced_decode_flag(self, size, max_side, grayscale=False):
+        """Pick the cheapest IMREAD_REDUCED_* flag that still leaves max_side pixels"""
+        full = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+        if size is None:
+            return full
+        width, height = size
+
+        scale = max(width, height) / max_side
+        if grayscale:
+            reduced = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                       (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                       (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+        else:
+            reduced = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                       (4, cv2.IMREAD_REDUCED_COLOR_4),
+                       (2, cv2.IMREAD_REDUCED_COLOR_2))
+        for factor, flag in reduced:
+            if scale >= factor:
+                return flag
+        return full
+
+    def _decode_image(self, image_data, max_side=None, grayscale=False):
+        """Decode raw bytes or a file path into an image no larger than max_side (default max_image_side)"""
+        max_side = max_side or self.max_image_side
+        if isinstance(image_data, bytes):
+            size = self._image_size(image_data)
+            if size and self.max_decode_pixels and size[0] * size[1] > self.max_decode_pixels:
+                logger.warning(f"Refusing to decode {size[0]}x{size[1]} image")
+                return None
+            nparr = np.frombuffer(image_data, np.uint8)
+            img = cv2.imdecode(nparr, self._reduced_decode_flag(size, max_side, grayscale))
+        else:
+            img = cv2.imread(image_data, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+
+        if img is None:
+            return None
+
+        # Reduced decoding only halves, so finish the last step with a resize
+        return self._limit_size(img, max_side)
+
+    def _limit_size(self, img, max_side=None):
+        """Downscale an image so its longest side is at most max_side (default max_image_side)"""
+        max_side = max_side or self.max_image_side
+        height, width = img.shape[:2]
+        scale = max_side / max(height, width)
+        if scale < 1:
+            img = cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        return img
+
+    def _face_crop(self, img, box):
+        """Crop the detected face plus a margin; returns the crop and its pixel offset"""
+        image_height, image_width = img.shape[:2]
+        xmin, ymin, width, height = box[:4]
+        margin = self.crop_margin * max(width * image_width, height * image_height)
+
+        x0 = max(int(xmin * image_width - margin), 0)
+        y0 = max(int(ymin * image_height - margin), 0)
+        x1 = min(int((xmin + width) * image_width + margin), image_width)
+        y1 = min(int((ymin + height) * image_height + margin), image_height)
+        if x1 <= x0 or y1 <= y0:
+            return img, (0, 0)
+        return img[y0:y1, x0:x1], (x0, y0)
+
+    def _mesh_landmarks(self, rgb_img, box):
+        """Run the face mesh on the crop around box and return landmarks relative to the whole image"""
+        crop, (x0, y0) = self._face_crop(rgb_img, box)
+        face_mesh_results = self.face_mesh.process(np.ascontiguousarray(crop))
+        if not face_mesh_results.multi_face_landmarks:
+            return None
+
+        image_height, image_width = rgb_img.shape[:2]
+        crop_height, crop_width = crop.shape[:2]
+        landmarks = self._landmark_array(face_mesh_results)
+        landmarks[:, 0] = (landmarks[:, 0] * crop_width + x0) / image_width
+        landmarks[:, 1] = (landmarks[:, 1] * crop_height + y0) / image_height
+        return landmarks
+
+    def _face_ratio(self, landmarks, image_shape):
+        """Face ratio for a single (468, 2) landmark array"""
+        image_height, image_width = image_shape[:2]
+        sizes = np.array([(image_width, image_height)], dtype=np.float64)
+        return float(self._calculate_face_ratios(landmarks[None], sizes)[0])
+
+    def _detection_boxes(self, face_detection_results):
+        """Convert MediaPipe detections into plain, picklable bounding boxes"""
+        boxes = []
+        for detection in face_detection_results.detections or []:
+            box = detection.location_data.relative_bounding_box
+            score = detection.score[0] if detection.score else 0.0
+            boxes.append((box.xmin, box.ymin, box.width, box.height, score))
+        return boxes
+
+    def _run_cascade(self, image_data):
+        """Run the spoof cascade; returns (rejection reason or None, context, trace)"""
+        context = CheckContext(self, image_data, self.cascade_gray_side)
+        reason, trace = self.cascade.run(context)
+        return reason, context, trace
+
+    def analyze(self, image_data):
+        """Run the spoof checks and age estimation with one decode and one pass of each model"""
+        result = AnalysisResult()
+        timer = StageTimer()
+        try:
+            # Cheap checks reject early; the ones that pass leave their decode,
+            # detections and landmarks on the context for the age estimate
+            reason, context, result.checks = self._run_cascade(image_data)
+            for name, _, elapsed_ms in result.checks:
+                timer.timings[f'check:{name}'] = elapsed_ms
+            result.detections = context.peek('detections', [])
+            if reason is not None:
+                return result.reject(reason)
+
+            # Checks can be disabled in config, so the models may not have run yet
+            if context.image is None:
+                return result.reject("Failed to load image")
+            with timer.stage('mesh'):
+                result.detections = context.detections
+                result.landmarks = context.landmarks
+            if not result.detections:
+                return result.reject("No face detected")
+            if result.landmarks is None:
+                return result.reject("Cannot extract facial features")
+
+            img = context.image
+            with timer.stage('features'):
+                result.face_ratio = self._face_ratio(result.landmarks, img.shape)
+                result.estimated_age = self._estimate_age_from_ratio(result.face_ratio)
+                result.descriptor = self.face_descriptor(result.landmarks, img.shape)
+                result.packed_landmarks = pack_landmarks(result.landmarks, (img.shape[1], img.shape[0]))
+
+            if self._is_animated(image_data):
+                # The cascade vetted the first frame; the estimate uses the whole animation
+                with timer.stage('animation'):
+                    ages, result.frames_analyzed, result.static_animation = \
+                        self._animation_estimates(image_data, first_age=result.estimated_age)
+                if ages:
+                    result.estimated_age = float(np.median(ages))
+
+            if result.estimated_age is None:
+                result.error = "Could not estimate age from facial features"
+
+            return result
+
+        except Exception as e:
+            logger.error(f"Error analyzing image: {e}")
+            return result.reject(f"Error in spoof detection: {str(e)}")
+
+        finally:
+            result.timings = timer.timings
+            logger.debug(f"Image analysis stage timings (ms): {timer.timings}")
+
     def process_image(self, image_data):
         """Process image data and estimate age"""
+        if self._is_animated(image_data):
+            return self.process_animation(image_data)
+
+        timer = StageTimer()
         try:
-            # Convert image data to numpy array
-            if isinstance(image_data, bytes):
-                nparr = np.frombuffer(image_data, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            else:
-                img = cv2.imread(image_data)
+            with timer.stage('decode'):
+                img = self._decode_image(image_data)
 
             if img is None:
                 return None, "Failed to load image"
@@ -96,18 +521,22 @@ class FaceDetector:
             rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
             # Detect face
-            face_detection_results = self.face_detection.process(rgb_img)
+            with timer.stage('detect'):
+                face_detection_results = self.face_detection.process(rgb_img)
             if not face_detection_results.detections:
                 return None, "No face detected in the image"
 
-            # Get facial landmarks
-            face_mesh_results = self.face_mesh.process(rgb_img)
-            if not face_mesh_results.multi_face_landmarks:
+            # Get facial landmarks from the face crop
+            with timer.stage('mesh'):
+                boxes = self._detection_boxes(face_detection_results)
+                landmarks = self._mesh_landmarks(rgb_img, boxes[0])
+            if landmarks is None:
                 return None, "Could not detect facial features"
 
             # Calculate facial features and estimate age
-            face_ratio = self._calculate_face_features(face_mesh_results, img.shape)
-            estimated_age = self._estimate_age_from_ratio(face_ratio)
+            with timer.stage('features'):
+                face_ratio = self._face_ratio(landmarks, img.shape)
+                estimated_age = self._estimate_age_from_ratio(face_ratio)
 
             if estimated_age is None:
                 return None, "Could not estimate age from facial features"
@@ -118,89 +547,347 @@ class FaceDetector:
             logger.error(f"Error processing image: {e}")
             return None, f"Error processing image: {str(e)}"
 
-    def process_video(self, video_data):
-        """Process video data and estimate age"""
+        finally:
+            logger.debug(f"Image processing stage timings (ms): {timer.timings}")
+
+    def process_batch(self, media_list):
+        """Estimate ages for many images, computing all facial features in one vectorized pass
+
+        Returns a list of (estimated_age, error) tuples in the same order as media_list.
+        """
+        results = [(None, None)] * len(media_list)
+        landmarks, sizes, indices = [], [], []
+
+        for i, image_data in enumerate(media_list):
+            try:
+                img = self._decode_image(image_data)
+                if img is None:
+                    results[i] = (None, "Failed to load image")
+                    continue
+
+                rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                boxes = self._detection_boxes(self.face_detection.process(rgb_img))
+                if not boxes:
+                    results[i] = (None, "No face detected in the image")
+                    continue
+
+                face_landmarks = self._mesh_landmarks(rgb_img, boxes[0])
+                if face_landmarks is None:
+                    results[i] = (None, "Could not detect facial features")
+                    continue
+
+                image_height, image_width = img.shape[:2]
+                landmarks.append(face_landmarks)
+                sizes.append((image_width, image_height))
+                indices.append(i)
+
+            except Exception as e:
+                logger.error(f"Error processing batch image {i}: {e}")
+                results[i] = (None, f"Error processing image: {str(e)}")
+
+        if indices:
+            ratios = self._calculate_face_ratios(
+                np.stack(landmarks),
+                np.array(sizes, dtype=np.float64)
+            )
+            ages = self._estimate_ages_from_ratios(ratios)
+            for i, age in zip(indices, ages):
+                results[i] = (float(age), None)
+
+        return results
+
+    def _spool_video(self, video_data):
+        """Write video bytes to a temporary file that OpenCV can open; the caller removes it"""
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as spool:
+            spool.write(video_data)
+            return spool.name
+
+    def _sample_video_frames(self, cap):
+        """Yield frames taken every video_sample_interval seconds, within the frame and pixel budget"""
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps <= 0 or fps > 240:
+            fps = 30.0
+        step = max(int(round(fps * self.video_sample_interval)), 1)
+
+        position = 0  # index of the next frame the decoder will return
+        decoded_pixels = 0
+        for sample in range(self.video_max_samples):
+            target = sample * step
+            skipped = target - position
+            if skipped > fps:
+                # Long gaps are cheaper to seek over than to walk through
+                cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                skipped = 0
+            else:
+                # grab() advances without converting the skipped frames to BGR
+                for _ in range(skipped):
+                    if not cap.grab():
+                        return
+
+            ok, frame = cap.read()
+            if not ok:
+                return
+            position = target + 1
+
+            decoded_pixels += frame.shape[0] * frame.shape[1] * (skipped + 1)
+            if decoded_pixels > self.video_max_pixels:
+                logger.info(f"Video pixel budget reached after {sample} sampled frames")
+                return
+
+            yield self._limit_size(frame)
+
+    def _frame_face(self, frame):
+        """Detect the face in a BGR frame; returns (box, landmarks), either may be None"""
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        boxes = self._detection_boxes(self.face_detection.process(rgb_frame))
+        if not boxes:
+            return None, None
+        return boxes[0], self._mesh_landmarks(rgb_frame, boxes[0])
+
+    def _estimate_frame_age(self, frame):
+        """Estimate age from a single BGR frame, or None if no usable face is found"""
+        _, landmarks = self._frame_face(frame)
+        if landmarks is None:
+            return None
+        return self._estimate_age_from_ratio(self._face_ratio(landmarks, frame.shape))
+
+    def _liveness_frame(self, frame):
+        """Small grayscale copy of a frame for motion tracking"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return self._limit_size(gray, self.liveness_side)
+
+    def _face_motion(self, previous, current, box):
+        """Non-rigid motion of the face between two small grayscale frames
+
+        Corners inside the face box are tracked with pyramidal Lucas-Kanade flow.
+        A photo moved in front of the camera follows one similarity transform,
+        so only the residual after fitting one counts as motion. Returns the
+        median residual in face widths, or None if too few points could be tracked.
+        """
+        height, width = previous.shape
+        xmin, ymin, box_width, box_height = box[:4]
+        x0, y0 = max(int(xmin * width), 0), max(int(ymin * height), 0)
+        x1, y1 = min(int((xmin + box_width) * width), width), min(int((ymin + box_height) * height), height)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+        mask = np.zeros_like(previous)
+        mask[y0:y1, x0:x1] = 255
+
+        points = cv2.goodFeaturesToTrack(previous, maxCorners=64, qualityLevel=0.01, minDistance=3, mask=mask)
+        if points is None or len(points) < 6:
+            return None
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, points, None, winSize=(15, 15), maxLevel=3)
+        tracked = status.ravel() == 1
+        if tracked.sum() < 6:
+            return None
+
+        source, target = points[tracked], moved[tracked]
+        transform, _ = cv2.estimateAffinePartial2D(source, target)
+        if transform is None:
+            return None
+        residuals = np.linalg.norm((target - cv2.transform(source, transform)).reshape(-1, 2), axis=1)
+        return float(np.median(residuals)) / (x1 - x0)
+
+    def _is_animated(self, image_data):
+        """Whether image bytes hold more than one frame, judged from the header"""
+        if not isinstance(image_data, bytes):
+            return False
         try:
-            # Save video data to temporary buffer
-            video_buffer = io.BytesIO(video_data)
-            
-            # Open video file
-            cap = cv2.VideoCapture(video_buffer.name)
-            
+            info = probe_header(image_data)
+        except ProbeError:
+            return False
+        return info.kind == 'image' and (info.frames or 1) > 1
+
+    def _sample_animation_frames(self, image_data):
+        """Yield BGR frames of an animated GIF/APNG every video_sample_interval seconds of playback
+
+        Frames are decoded lazily one at a time. Every frame has to be decoded
+        to composite the next one, so all of them count towards animation_max_pixels.
+        """
+        with Image.open(io.BytesIO(image_data)) as animation:
+            decoded_pixels = 0
+            sampled = 0
+            elapsed = 0.0
+            next_sample = 0.0
+            for frame in ImageSequence.Iterator(animation):
+                decoded_pixels += frame.width * frame.height
+                if decoded_pixels > self.animation_max_pixels:
+                    logger.info(f"Animation pixel budget reached after {sampled} sampled frames")
+                    return
+
+                if elapsed >= next_sample:
+                    rgb = np.asarray(frame.convert('RGB'))
+                    yield self._limit_size(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+                    sampled += 1
+                    if sampled >= self.animation_max_frames:
+                        return
+                    next_sample = elapsed + self.video_sample_interval
+
+                # Browsers play zero-delay frames at 100 ms, so count them the same way
+                elapsed += (frame.info.get('duration') or 100) / 1000
+
+    def _frame_signature(self, frame):
+        """Tiny grayscale thumbnail for cheap frame-to-frame comparison"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def _animation_estimates(self, image_data, first_age=None):
+        """Per-frame age estimates of an animated image
+
+        Returns (age estimates, frames sampled, static), where static means
+        the samples were all the same picture. When first_age is given
+        the first frame has already been analysed and is not run through the
+        models again.
+        """
+        ages = [] if first_age is None else [first_age]
+        sampled = 0
+        duplicates = 0
+        previous = None
+        for frame in self._sample_animation_frames(image_data):
+            sampled += 1
+            signature = self._frame_signature(frame)
+            if previous is not None:
+                if np.abs(signature - previous).mean() <= self.animation_static_threshold:
+                    duplicates += 1
+                    if duplicates >= self.animation_static_frames:
+                        logger.info(f"Animation is a still image, stopped after {sampled} frames")
+                        return ages, sampled, True
+                    # A duplicate frame cannot change the estimate
+                    continue
+                duplicates = 0
+            previous = signature
+
+            if sampled == 1 and first_age is not None:
+                continue
+            estimated_age = self._estimate_frame_age(frame)
+            if estimated_age is None:
+                continue
+            ages.append(estimated_age)
+            if ages.count(estimated_age) >= self.video_consensus:
+                break
+        # A short animation can end before animation_static_frames duplicates in a row;
+        # it is still a still image when every sample after the first was a duplicate
+        static = sampled > 1 and duplicates == sampled - 1
+        if static:
+            logger.info(f"Animation is a still image, all {sampled} sampled frames are the same")
+        return ages, sampled, static
+
+    def process_animation(self, image_data):
+        """Estimate age from frames sampled across an animated GIF or APNG"""
+        timer = StageTimer()
+        try:
+            with timer.stage('analyze'):
+                ages, _, _ = self._animation_estimates(image_data)
+            if not ages:
+                return None, "No faces detected in animation"
+            return float(np.median(ages)), None
+
+        except Exception as e:
+            logger.error(f"Error processing animation: {e}")
+            return None, f"Error processing animation: {str(e)}"
+
+        finally:
+            logger.debug(f"Animation processing stage timings (ms): {timer.timings}")
+
+    def analyze_video(self, video_data):
+        """Estimate age and liveness from video frames sampled at fixed time intervals"""
+        result = AnalysisResult()
+        result.frames_analyzed = 0
+        timer = StageTimer()
+        path = None
+        cap = None
+        try:
+            with timer.stage('spool'):
+                path = self._spool_video(video_data)
+
+            cap = cv2.VideoCapture(path)
             if not cap.isOpened():
-                return None, "Failed to open video"
+                result.error = "Failed to open video"
+                return result
 
             age_estimates = []
-            frame_count = 0
-            max_frames = 30  # Process up to 30 frames
-
-            while frame_count < max_frames:
-                ret, frame = cap.read()
-                if not ret:
+            frame_landmarks = []
+            motions = []
+            previous = None  # (small grayscale frame, face box) of the last sample with a face
+            consensus = False  # enough samples agree; later ones are only tracked for liveness
+            frames = self._sample_video_frames(cap)
+            while True:
+                with timer.stage('decode'):
+                    frame = next(frames, None)
+                if frame is None:
                     break
-
-                # Process every 5th frame
-                if frame_count % 5 == 0:
-                    # Convert to RGB
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    
-                    # Detect face and get landmarks
-                    face_detection_results = self.face_detection.process(rgb_frame)
-                    if face_detection_results.detections:
-                        face_mesh_results = self.face_mesh.process(rgb_frame)
-                        if face_mesh_results.multi_face_landmarks:
-                            face_ratio = self._calculate_face_features(face_mesh_results, frame.shape)
-                            estimated_age = self._estimate_age_from_ratio(face_ratio)
-                            if estimated_age is not None:
-                                age_estimates.append(estimated_age)
-
-                frame_count += 1
-
-            cap.release()
+                result.frames_analyzed += 1
+
+                with timer.stage('analyze'):
+                    box, landmarks = self._frame_face(frame)
+                if box is None:
+                    previous = None
+                    continue
+
+                with timer.stage('liveness'):
+                    gray = self._liveness_frame(frame)
+                    if previous is not None:
+                        motion = self._face_motion(previous[0], gray, previous[1])
+                        if motion is not None:
+                            motions.append(motion)
+                    previous = (gray, box)
+
+                if consensus:
+                    if len(motions) >= self.liveness_min_pairs:
+                        break
+                    continue
+                if landmarks is None:
+                    continue
+                frame_landmarks.append(landmarks)
+                frame_size = (frame.shape[1], frame.shape[0])
+                estimated_age = self._estimate_age_from_ratio(self._face_ratio(landmarks, frame.shape))
+                if estimated_age is None:
+                    continue
+
+                age_estimates.append(estimated_age)
+                # Stop as soon as enough sampled frames agree and enough motion was tracked
+                if age_estimates.count(estimated_age) >= self.video_consensus:
+                    consensus = True
+                    if len(motions) >= self.liveness_min_pairs:
+                        break
+
+            if motions:
+                # Mean over frame pairs of each pair's median displacement, see _face_motion
+                result.liveness = float(min(np.mean(motions) / self.liveness_reference, 1.0))
+            if frame_landmarks:
+                result.packed_landmarks = pack_landmarks(frame_landmarks, frame_size)
 
             if not age_estimates:
-                return None, "No faces detected in video"
+                result.error = "No faces detected in video"
+                return result
 
             # Return median age estimation
-            median_age = float(np.median(age_estimates))
-            return median_age, None
+            result.estimated_age = float(np.median(age_estimates))
+            return result
 
         except Exception as e:
             logger.error(f"Error processing video: {e}")
-            return None, f"Error processing video: {str(e)}"
+            result.error = f"Error processing video: {str(e)}"
+            return result
+
+        finally:
+            if cap is not None:
+                cap.release()
+            if path is not None:
+                os.remove(path)
+            result.timings = timer.timings
+            logger.debug(f"Video processing stage timings (ms): {timer.timings}")
+
+    def process_video(self, video_data):
+        """Process video data and estimate age from frames sampled at fixed time intervals"""
+        result = self.analyze_video(video_data)
+        return result.estimated_age, result.error
 
     def is_spoof(self, image_data):
         """Check for potential spoofing attempts"""
         try:
-            # Convert image data to numpy array
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                return True, "Failed to load image"
-
-            # Convert to RGB
-            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            
-            # Basic quality checks
-            blur_score = cv2.Laplacian(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
-            if blur_score < 100:
-                return True, "Image too blurry - possible printed photo"
-
-            # Check face detection
-            face_detection_results = self.face_detection.process(rgb_img)
-            if not face_detection_results.detections:
-                return True, "No face detected"
-            
-            if len(face_detection_results.detections) > 1:
-                return True, "Multiple faces detected"
-
-            # Get face mesh for detailed analysis
-            face_mesh_results = self.face_mesh.process(rgb_img)
-            if not face_mesh_results.multi_face_landmarks:
-                return True, "Cannot extract facial features"
-
-            return False, None
+            reason, _, _ = self._run_cascade(image_data)
+            return reason is not None, reason
 
         except Exception as e:
             logger.error(f"Error in spoof detection: {e}")
@@ -0,0 +1,163 @@
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger('age-verify-bot')
+
+DESCRIPTOR_DTYPE = np.float16
+
+# Every COARSE_STRIDE-th descriptor dimension forms the coarse pre-filter
+COARSE_STRIDE = 8
+
+
+def encode_descriptor(descriptor):
+    """Pack a face descriptor as float16 bytes for storage"""
+    return np.asarray(descriptor, dtype=DESCRIPTOR_DTYPE).tobytes()
+
+
+def decode_descriptor(data):
+    """Unpack float16 descriptor bytes into a float32 vector"""
+    return np.frombuffer(data, dtype=DESCRIPTOR_DTYPE).astype(np.float32)
+
+
+class FaceMatch:
+    """A stored face close to the one being checked"""
+
+    def __init__(self, user_id, distance, banned):
+        self.user_id = user_id
+        self.distance = distance
+        self.banned = banned
+
+
+class FaceIndex:
+    """In-memory nearest-neighbour index over face descriptors
+
+    Descriptors are rows of one float32 matrix. A query first scans a small
+    coarse matrix holding every COARSE_STRIDE-th dimension; since a partial
+    squared distance never exceeds the full one, that pre-filter cannot drop a
+    true match, and only the surviving rows are compared in full. Distances
+    are RMS landmark offsets in units of the inter-eye distance (see
+    FaceDetector.face_descriptor).
+    """
+
+    def __init__(self, max_distance=0.03, initial_capacity=1024):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._norms = None
+        self._coarse = None
+        self._coarse_norms = None
+        self._user_ids = []
+        self._banned = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._initial_capacity = initial_capacity
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, dimensions):
+        """Double the matrix capacity so incremental adds stay amortized O(1)"""
+        capacity = self._initial_capacity if self._matrix is None else 2 * len(self._matrix)
+        matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+        coarse = np.zeros((capacity, len(range(0, dimensions, COARSE_STRIDE))), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        coarse_norms = np.zeros(capacity, dtype=np.float32)
+        banned = np.zeros(capacity, dtype=bool)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+            coarse[:self._size] = self._coarse[:self._size]
+            norms[:self._size] = self._norms[:self._size]
+            coarse_norms[:self._size] = self._coarse_norms[:self._size]
+            banned[:self._size] = self._banned[:self._size]
+        self._matrix, self._coarse, self._banned = matrix, coarse, banned
+        self._norms, self._coarse_norms = norms, coarse_norms
+
+    def _store(self, start, vectors):
+        """Write rows of descriptors and their precomputed norms starting at start"""
+        end = start + len(vectors)
+        coarse = vectors[:, ::COARSE_STRIDE]
+        self._matrix[start:end] = vectors
+        self._coarse[start:end] = coarse
+        self._norms[start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self._coarse_norms[start:end] = np.einsum('ij,ij->i', coarse, coarse)
+
+    def add(self, user_id, descriptor, banned=False):
+        """Add one descriptor for a user"""
+        vector = np.asarray(descriptor, dtype=np.float32).ravel()
+        with self._lock:
+            if self._matrix is None or self._size == len(self._matrix):
+                self._grow(len(vector))
+            self._store(self._size, vector[None])
+            self._banned[self._size] = banned
+            self._user_ids.append(str(user_id))
+            self._size += 1
+
+    def set_banned(self, user_id, banned=True):
+        """Mark every descriptor of a user as banned (or not)"""
+        user_id = str(user_id)
+        with self._lock:
+            for i, owner in enumerate(self._user_ids):
+                if owner == user_id:
+                    self._banned[i] = banned
+
+    def rebuild(self, rows):
+        """Replace the index contents with (user_id, descriptor_bytes, banned) rows"""
+        user_ids, vectors, banned = [], [], []
+        for user_id, data, is_banned in rows:
+            user_ids.append(str(user_id))
+            vectors.append(decode_descriptor(data))
+            banned.append(bool(is_banned))
+
+        with self._lock:
+            self._matrix = None
+            self._user_ids = []
+            self._size = 0
+            if vectors:
+                stacked = np.stack(vectors)
+                self._initial_capacity = max(self._initial_capacity, len(stacked))
+                self._grow(stacked.shape[1])
+                self._store(0, stacked)
+                self._banned[:len(stacked)] = banned
+                self._user_ids = user_ids
+                self._size = len(stacked)
+        logger.info(f"Face index rebuilt with {self._size} descriptors")
+
+    def search(self, descriptor, exclude_user=None, limit=5):
+        """Return up to limit FaceMatch objects within max_distance, closest first"""
+        vector = np.asarray(descriptor, dtype=np.float32).ravel()
+        with self._lock:
+            if not self._size:
+                return []
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b, with ||b||^2 precomputed per row
+            limit_squared = self.max_distance ** 2 * len(vector)
+
+            coarse_vector = vector[::COARSE_STRIDE]
+            coarse_scores = self._coarse[:self._size] @ coarse_vector
+            coarse_scores *= -2
+            coarse_scores += self._coarse_norms[:self._size]
+            candidates = np.flatnonzero(coarse_scores <= limit_squared - coarse_vector @ coarse_vector)
+
+            if len(candidates) > self._size // 4:
+                # Gathering most rows costs more than one contiguous full scan
+                candidates = np.arange(self._size)
+                rows, norms = self._matrix[:self._size], self._norms[:self._size]
+            else:
+                rows, norms = self._matrix[candidates], self._norms[candidates]
+            squared = norms + vector @ vector - 2 * (rows @ vector)
+            distances = np.sqrt(np.maximum(squared, 0) / len(vector))
+            within = distances <= self.max_distance
+            candidates, distances = candidates[within], distances[within]
+            order = np.argsort(distances)
+            candidates, distances = candidates[order], distances[order]
+
+            matches, seen = [], set()
+            for i, distance in zip(candidates, distances):
+                user_id = self._user_ids[i]
+                if user_id == exclude_user or user_id in seen:
+                    continue
+                seen.add(user_id)
+                matches.append(FaceMatch(user_id, float(distance), bool(self._banned[i])))
+                if len(matches) == limit:
+                    break
+            return matches
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.utils.face_detection import AnalysisResult
+
+logger = logging.getLogger('age-verify-bot')
+
+# FaceDetector owned by the current worker process
+_worker_detector = None
+
+
+def _init_worker(detector_options, stats_queue):
+    """Load and warm up the shared FaceDetector of this worker process and report its statistics"""
+    global _worker_detector
+    from src.utils.detector_registry import registry
+
+    stats = registry.warm_up(**detector_options)
+    stats['pid'] = os.getpid()
+    stats_queue.put(stats)
+    _worker_detector = registry.get(**detector_options)
+
+
+def _run_job(method, args):
+    """Run a FaceDetector method inside the worker process"""
+    return getattr(_worker_detector, method)(*args)
+
+
+def _ping():
+    """Job used to start the worker processes"""
+    return os.getpid()
+
+
+class InferenceTimeout(Exception):
+    """Raised when an inference job does not finish in time"""
+
+
+# A job that timed out would time out again and restart the pool once more, taking every
+# job running alongside it down too, so timeouts are final rather than transient
+TIMEOUT_MESSAGE = "Your media took too long to analyse, please send a smaller or shorter file"
+
+
+class TransientAnalysisError(Exception):
+    """Raised when media could not be analysed for a reason that may go away on retry"""
+
+
+class InferenceExecutor:
+    """Runs CPU-bound FaceDetector calls in a pool of worker processes"""
+
+    def __init__(self, max_workers=2, timeout=30, max_retries=1, detector_options=None):
+        self.max_workers = max_workers
+        self.detector_options = detector_options or {}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._pool = None
+        self._stats_queue = None
+        self._worker_stats = {}
+        # Admits at most max_workers jobs to the pool, so a job's timeout only runs
+        # while a worker has it rather than while it waits in the pool's queue
+        self._slots = None
+
+    def _create_pool(self):
+        # Each pool gets its own queue, so workers of a torn-down pool cannot report into the new one
+        self._stats_queue = self._context.Queue()
+        self._worker_stats = {}
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self.detector_options, self._stats_queue)
+        )
+
+    @property
+    def worker_stats(self):
+        """pid -> detector load statistics of every worker the current pool has started"""
+        while self._stats_queue is not None:
+            try:
+                stats = self._stats_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._worker_stats[stats['pid']] = stats
+        return self._worker_stats
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = self._create_pool()
+        return self._pool
+
+    def _restart_pool(self, reason, pool):
+        """Tear down pool, the one a failed job ran on, so the next job starts a fresh one
+
+        Does nothing when another job already replaced that pool, so a late
+        failure from the old pool does not take down jobs on the new one.
+        """
+        if pool is not self._pool:
+            return
+        logger.warning(f"Restarting inference pool: {reason}")
+        self._pool = None
+        if pool is not None:
+            # A stuck worker never returns, so it has to be terminated
+            for process in list(getattr(pool, '_processes', {}).values()):
+                process.terminate()
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._stats_queue = None
+        self._worker_stats = {}
+        self.restarts += 1
+
+    async def start(self):
+        """Spawn the workers so their detectors are warm before the first job
+
+        Pings submitted together make the pool spawn every worker, and each
+        worker warms up in its initializer and reports to worker_stats, even
+        if all pings end up on the same one.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            await asyncio.gather(*(
+                loop.run_in_executor(pool, _ping) for _ in range(self.max_workers)
+            ))
+        except BrokenProcessPool as e:
+            self._restart_pool(f"worker failed to start: {e}", pool)
+            return
+        logger.info(f"Inference pool started with {self.max_workers} workers")
+
+    async def run(self, method, *args, timeout=None):
+        """Run a FaceDetector method in the pool and wait for its result"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            return await self._run(method, args, timeout or self.timeout)
+
+    async def _run(self, method, args, timeout):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            pool = self._get_pool()
+            future = loop.run_in_executor(pool, _run_job, method, args)
+            try:
+                return await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                self._restart_pool(f"{method} exceeded {timeout}s", pool)
+                raise InferenceTimeout(f"{method} timed out after {timeout} seconds")
+            except BrokenProcessPool:
+                self._restart_pool(f"worker crashed during {method}", pool)
+                if attempt == self.max_retries:
+                    raise
+
+    async def analyze(self, image_data):
+        """Async wrapper for FaceDetector.analyze"""
+        try:
+            return await self.run('analyze', image_data)
+        except InferenceTimeout as e:
+            logger.error(f"Image analysis timed out in inference pool: {e}")
+            return AnalysisResult().reject(TIMEOUT_MESSAGE)
+        except BrokenProcessPool as e:
+            logger.error(f"Image analysis failed in inference pool: {e}")
+            result = AnalysisResult().reject("Image analysis failed, please try again later")
+            result.transient = True
+            return result
+
+    async def is_spoof(self, image_data):
+        """Async wrapper for FaceDetector.is_spoof"""
+        try:
+            return await self.run('is_spoof', image_data)
+        except (InferenceTimeout, BrokenProcessPool) as e:
+            logger.error(f"Spoof check failed in inference pool: {e}")
+            return True, "Image analysis failed, please try again later"
+
+    async def process_image(self, image_data):
+        """Async wrapper for FaceDetector.process_image"""
+        try:
+            return await self.run('process_image', image_data)
+        except (InferenceTimeout, BrokenProcessPool) as e:
+            logger.error(f"Image processing failed in inference pool: {e}")
+            return None, "Image analysis failed, please try again later"
+
+    async def process_animation(self, image_data):
+        """Async wrapper for FaceDetector.process_animation"""
+        try:
+            return await self.run('process_animation', image_data)
+        except (InferenceTimeout, BrokenProcessPool) as e:
+            logger.error(f"Animation processing failed in inference pool: {e}")
+            return None, "Image analysis failed, please try again later"
+
+    async def analyze_video(self, video_data):
+        """Async wrapper for FaceDetector.analyze_video"""
+        try:
+            return await self.run('analyze_video', video_data)
+        except InferenceTimeout as e:
+            logger.error(f"Video analysis timed out in inference pool: {e}")
+            result = AnalysisResult()
+            result.error = TIMEOUT_MESSAGE
+            return result
+        except BrokenProcessPool as e:
+            logger.error(f"Video analysis failed in inference pool: {e}")
+            result = AnalysisResult()
+            result.error = "Video analysis failed, please try again later"
+            result.transient = True
+            return result
+
+    async def process_video(self, video_data):
+        """Async wrapper for FaceDetector.process_video"""
+        try:
+            return await self.run('process_video', video_data)
+        except (InferenceTimeout, BrokenProcessPool) as e:
+            logger.error(f"Video processing failed in inference pool: {e}")
+            return None, "Video analysis failed, please try again later"
+
+    async def process_batch(self, media_list):
+        """Async wrapper for FaceDetector.process_batch, allowing one job timeout per image"""
+        try:
+            return await self.run(
+                'process_batch', media_list,
+                timeout=self.timeout * max(len(media_list), 1)
+            )
+        except (InferenceTimeout, BrokenProcessPool) as e:
+            logger.error(f"Batch processing failed in inference pool: {e}")
+            return [(None, "Image analysis failed, please try again later")] * len(media_list)
+
+    def shutdown(self):
+        """Stop all worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._stats_queue = None
@@ -0,0 +1,42 @@
+import struct
+
+import numpy as np
+
+# Packed layout: width, height and frame count as little-endian uint16,
+# then frames x 468 x 2 relative mesh coordinates as float16 (about 1.9 KB per frame)
+LANDMARK_HEADER = struct.Struct('<HHH')
+LANDMARK_DTYPE = np.dtype('<f2')
+MESH_POINTS = 468
+
+
+def pack_landmarks(frames, image_size):
+    """Pack one or more (468, 2) landmark arrays measured on an image of image_size (width, height)"""
+    frames = np.asarray(frames, dtype=LANDMARK_DTYPE).reshape(-1, MESH_POINTS, 2)
+    width, height = image_size
+    return LANDMARK_HEADER.pack(width, height, len(frames)) + frames.tobytes()
+
+
+def unpack_landmarks(data):
+    """Unpack landmark bytes into a (frames, 468, 2) float32 array and the (width, height) image size"""
+    width, height, count = LANDMARK_HEADER.unpack_from(data)
+    frames = np.frombuffer(data, LANDMARK_DTYPE, count * MESH_POINTS * 2, LANDMARK_HEADER.size)
+    return frames.reshape(count, MESH_POINTS, 2).astype(np.float32), (width, height)
+
+
+def stack_landmarks(blobs):
+    """Stack many packed landmark blobs for vectorized scoring
+
+    Returns (frames, sizes, owners): an (M, 468, 2) float16 array of every
+    stored frame, left unconverted so callers only widen the points they use,
+    their (M, 2) image sizes, and the index in blobs each frame came from.
+    """
+    headers = [LANDMARK_HEADER.unpack_from(data) for data in blobs]
+    if not headers:
+        return np.zeros((0, MESH_POINTS, 2), LANDMARK_DTYPE), np.zeros((0, 2)), np.zeros(0, np.intp)
+
+    dimensions = np.array([(width, height) for width, height, _ in headers], dtype=np.float64)
+    counts = np.array([count for _, _, count in headers], dtype=np.intp)
+    # One buffer for all rows instead of an array per row
+    payload = b''.join(data[LANDMARK_HEADER.size:] for data in blobs)
+    frames = np.frombuffer(payload, LANDMARK_DTYPE).reshape(-1, MESH_POINTS, 2)
+    return frames, np.repeat(dimensions, counts, axis=0), np.repeat(np.arange(len(blobs)), counts)
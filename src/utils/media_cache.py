@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from src.utils.media_probe import ProbeError, probe_header
+
+logger = logging.getLogger('age-verify-bot')
+
+
+def perceptual_hash(image_data, max_pixels=40_000_000):
+    """64-bit difference hash of an image, stable across re-encoding and resizing
+
+    Returns None without decoding when the header is unreadable or declares more
+    than max_pixels; this runs in the bot process, and reduced decoding does not
+    shrink PNG or GIF decodes.
+    """
+    try:
+        info = probe_header(image_data)
+    except ProbeError:
+        return None
+    if info.pixels is None or (max_pixels and info.pixels > max_pixels):
+        return None
+
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class MediaFingerprint:
+    """Exact and perceptual identity of a piece of submitted media"""
+
+    def __init__(self, sha256, phash=None):
+        self.sha256 = sha256
+        self.phash = phash
+
+
+class CacheEntry:
+    """Cached analysis outcome for one piece of media"""
+
+    def __init__(self, fingerprint, estimated_age, error, analysis=None):
+        self.fingerprint = fingerprint
+        self.estimated_age = estimated_age
+        self.error = error
+        self.analysis = analysis  # AnalysisResult with the descriptor, liveness and landmarks
+        self.created = time.monotonic()
+        self.user_ids = set()
+
+
+class MediaCache:
+    """LRU cache of analysis results keyed by SHA-256, with perceptual-hash fallback"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=86400, max_hash_distance=4, max_decode_pixels=40_000_000):
+        self.max_entries = max_entries
+        self.max_decode_pixels = max_decode_pixels
+        self.ttl_seconds = ttl_seconds
+        self.max_hash_distance = max_hash_distance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # sha256 -> CacheEntry
+
+    def fingerprint(self, media_data, media_type):
+        """Hash media for lookups; CPU-bound, so call it off the event loop"""
+        sha256 = hashlib.sha256(media_data).hexdigest()
+        phash = None
+        if media_type == 'photo':
+            try:
+                phash = perceptual_hash(media_data, self.max_decode_pixels)
+            except Exception as e:
+                logger.error(f"Error computing perceptual hash: {e}")
+        return MediaFingerprint(sha256, phash)
+
+    def _expired(self, entry):
+        return time.monotonic() - entry.created > self.ttl_seconds
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones over max_entries"""
+        for sha256 in [k for k, entry in self._entries.items() if self._expired(entry)]:
+            del self._entries[sha256]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _find_similar(self, phash):
+        """Find an entry whose perceptual hash is within max_hash_distance bits"""
+        for entry in self._entries.values():
+            other = entry.fingerprint.phash
+            if other is not None and bin(other ^ phash).count('1') <= self.max_hash_distance:
+                return entry
+        return None
+
+    def get(self, fingerprint):
+        """Return the cached entry for this media, or None"""
+        self._evict()
+        entry = self._entries.get(fingerprint.sha256)
+        if entry is None and fingerprint.phash is not None:
+            entry = self._find_similar(fingerprint.phash)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(entry.fingerprint.sha256)
+        self.hits += 1
+        return entry
+
+    def put(self, fingerprint, estimated_age, error, analysis=None):
+        """Store an analysis outcome and return its entry"""
+        entry = CacheEntry(fingerprint, estimated_age, error, analysis)
+        self._entries[fingerprint.sha256] = entry
+        self._entries.move_to_end(fingerprint.sha256)
+        self._evict()
+        return entry
+
+    def record_submitter(self, entry, user_id):
+        """Remember who submitted this media; returns the other users who sent the same media"""
+        entry.user_ids.add(str(user_id))
+        return entry.user_ids - {str(user_id)}
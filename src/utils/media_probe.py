@@ -0,0 +1,307 @@
+import logging
+import struct
+
+logger = logging.getLogger('age-verify-bot')
+
+# SOFn markers carry the frame size; C4, C8 and CC share the range but are not frames
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# MP4/MOV container boxes that have to be opened to reach the track metadata
+MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+# Top-level boxes a file can start with; older QuickTime movies have no ftyp box
+MP4_LEADING_BOXES = {b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot'}
+
+
+class ProbeError(Exception):
+    """Raised when a header cannot be parsed"""
+
+
+class MediaInfo:
+    """Dimensions and length of a media file, read from its header only"""
+
+    def __init__(self, kind, width=None, height=None, frames=None, duration=None, complete=True):
+        self.kind = kind
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.duration = duration  # seconds
+        # False when the probe ran out of data, e.g. GIF frames counted from a prefix only
+        self.complete = complete
+
+    @property
+    def pixels(self):
+        if self.width is None or self.height is None:
+            return None
+        return self.width * self.height
+
+
+def _probe_png(data):
+    if len(data) < 24 or data[12:16] != b'IHDR':
+        raise ProbeError("PNG header is missing IHDR")
+    width, height = struct.unpack('>II', data[16:24])
+
+    # Animated PNGs declare their frame count in acTL, which precedes the image data
+    frames, offset = 1, 8
+    while offset + 8 <= len(data):
+        length, chunk = struct.unpack('>I4s', data[offset:offset + 8])
+        if chunk == b'acTL' and offset + 12 <= len(data):
+            frames = struct.unpack('>I', data[offset + 8:offset + 12])[0]
+            break
+        if chunk == b'IDAT':
+            break
+        offset += length + 12
+    return MediaInfo('image', width, height, frames)
+
+
+def _probe_jpeg(data):
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise ProbeError("Corrupted JPEG marker")
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                break
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return MediaInfo('image', width, height, 1)
+        if marker == 0xDA:
+            break
+        offset += 2 + length
+    raise ProbeError("JPEG frame header not found")
+
+
+def _skip_gif_sub_blocks(data, offset):
+    while offset < len(data):
+        size = data[offset]
+        offset += 1 + size
+        if size == 0:
+            return offset
+    return None
+
+
+def _probe_gif(data):
+    if len(data) < 13:
+        raise ProbeError("GIF header is truncated")
+    width, height, flags = struct.unpack('<HHB', data[6:11])
+    offset = 13
+    if flags & 0x80:
+        offset += 3 * (2 << (flags & 0x07))
+
+    # Count frames and track the largest frame, as far as the data goes
+    frames = 0
+    while offset is not None and offset < len(data):
+        block = data[offset]
+        if block == 0x3B:
+            return MediaInfo('image', width, height, frames)
+        if block == 0x21:
+            offset = _skip_gif_sub_blocks(data, offset + 2)
+        elif block == 0x2C:
+            if offset + 10 > len(data):
+                break
+            frame_width, frame_height, frame_flags = struct.unpack('<HHB', data[offset + 5:offset + 10])
+            width, height = max(width, frame_width), max(height, frame_height)
+            frames += 1
+            offset += 10
+            if frame_flags & 0x80:
+                offset += 3 * (2 << (frame_flags & 0x07))
+            # LZW minimum code size, then the image data sub-blocks
+            offset = _skip_gif_sub_blocks(data, offset + 1)
+        else:
+            raise ProbeError("Corrupted GIF block")
+    return MediaInfo('image', width, height, frames, complete=False)
+
+
+def _box_header(data, offset=0):
+    """Return (type, header length, box size) of the box at offset; size 0 means 'to the end'"""
+    if offset + 8 > len(data):
+        raise ProbeError("MP4 box header is truncated")
+    size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+    if size == 1:
+        if offset + 16 > len(data):
+            raise ProbeError("MP4 box header is truncated")
+        return box_type, 16, struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+    return box_type, 8, size
+
+
+def iter_boxes(data, offset=0, end=None):
+    """Yield (type, payload start, box end) for the MP4/MOV boxes in data[offset:end]"""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        box_type, header, size = _box_header(data, offset)
+        if size == 0:
+            size = end - offset
+        if size < header:
+            raise ProbeError("Corrupted MP4 box")
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def is_mp4(data):
+    """Whether data starts like an MP4 or QuickTime file"""
+    return data[4:8] in MP4_LEADING_BOXES
+
+
+def parse_moov(data):
+    """Read duration, video size and frame count from the payload of a moov box"""
+    try:
+        return _parse_moov(data)
+    except (struct.error, IndexError) as e:
+        # Fields cut off by a truncated or corrupted box
+        raise ProbeError(f"MP4 metadata is corrupted: {e}")
+
+
+def _parse_moov(data):
+    info = MediaInfo('video')
+    tracks = []
+
+    def walk(start, end, track):
+        for box_type, payload, box_end in iter_boxes(data, start, min(end, len(data))):
+            if box_end > len(data):
+                raise ProbeError("MP4 metadata is truncated")
+            if box_type == b'mvhd':
+                version = data[payload]
+                if version == 1:
+                    timescale, duration = struct.unpack('>IQ', data[payload + 20:payload + 32])
+                else:
+                    timescale, duration = struct.unpack('>II', data[payload + 12:payload + 20])
+                if timescale:
+                    info.duration = duration / timescale
+            elif box_type == b'trak':
+                track = {}
+                tracks.append(track)
+                walk(payload, box_end, track)
+            elif box_type == b'tkhd' and track is not None:
+                # Width and height are the last two 16.16 fixed-point fields
+                width, height = struct.unpack('>II', data[box_end - 8:box_end])
+                track['width'], track['height'] = width >> 16, height >> 16
+            elif box_type == b'hdlr' and track is not None:
+                track['handler'] = data[payload + 8:payload + 12]
+            elif box_type == b'stsz' and track is not None:
+                track['frames'] = struct.unpack('>I', data[payload + 8:payload + 12])[0]
+            elif box_type in MP4_CONTAINERS:
+                walk(payload, box_end, track)
+
+    walk(0, len(data), None)
+
+    for track in tracks:
+        if track.get('handler') == b'vide':
+            info.width, info.height = track.get('width'), track.get('height')
+            info.frames = track.get('frames')
+            break
+    return info
+
+
+def probe_header(data):
+    """Identify an image or video from its leading bytes and read its size without decoding
+
+    For MP4/MOV this only succeeds when the moov box lies within data; use
+    probe_remote to follow the box layout of a file that is not in memory.
+    """
+    try:
+        return _probe_header(data)
+    except (struct.error, IndexError) as e:
+        raise ProbeError(f"Media header is corrupted: {e}")
+
+
+def _probe_header(data):
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return _probe_png(data)
+    if data.startswith(b'\xff\xd8'):
+        return _probe_jpeg(data)
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return _probe_gif(data)
+    if is_mp4(data):
+        for box_type, payload, box_end in iter_boxes(data):
+            if box_type == b'moov':
+                if box_end > len(data):
+                    raise ProbeError("MP4 metadata is truncated")
+                return parse_moov(data[payload:box_end])
+        raise ProbeError("MP4 metadata not found")
+    raise ProbeError("Unrecognised media format")
+
+
+async def probe_remote(read_range, size, header_bytes=65536, max_metadata_bytes=4 * 1024 * 1024):
+    """Probe a file that is not in memory using ranged reads
+
+    read_range(start, end) must be a coroutine returning data[start:end].
+    Images are probed from the first header_bytes; for MP4/MOV only the
+    top-level box headers and the moov box are read, wherever they are.
+    """
+    head = await read_range(0, min(header_bytes, size))
+    if head.startswith(b'\xff\xd8') and len(head) < size:
+        # Large EXIF or ICC segments can push the frame header past the prefix
+        return await _probe_remote_jpeg(read_range, head, size, max_metadata_bytes)
+    if not is_mp4(head):
+        return probe_header(head)
+
+    offset = 0
+    while offset + 8 <= size:
+        if offset + 16 <= len(head):
+            box_header = head[offset:offset + 16]
+        else:
+            box_header = await read_range(offset, min(offset + 16, size))
+        box_type, header, box_size = _box_header(box_header)
+        if box_size == 0:
+            box_size = size - offset
+        if box_size < header:
+            raise ProbeError("Corrupted MP4 box")
+
+        if box_type == b'moov':
+            if box_size > max_metadata_bytes:
+                raise ProbeError("MP4 metadata is too large")
+            if offset + box_size <= len(head):
+                moov = head[offset + header:offset + box_size]
+            else:
+                moov = await read_range(offset + header, offset + box_size)
+            return parse_moov(moov)
+        offset += box_size
+    raise ProbeError("MP4 metadata not found")
+
+
+async def _probe_remote_jpeg(read_range, head, size, max_metadata_bytes):
+    """Follow the JPEG segment chain with ranged reads until the frame header"""
+    async def peek(start, length):
+        if start + length <= len(head):
+            return head[start:start + length]
+        return await read_range(start, min(start + length, size))
+
+    offset = 2
+    while offset + 4 <= min(size, max_metadata_bytes):
+        marker = await peek(offset, 9)
+        if marker[0] != 0xFF:
+            raise ProbeError("Corrupted JPEG marker")
+        if marker[1] == 0xFF:
+            offset += 1
+            continue
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            offset += 2
+            continue
+        if marker[1] in JPEG_SOF_MARKERS:
+            if len(marker) < 9:
+                break
+            height, width = struct.unpack('>HH', marker[5:9])
+            return MediaInfo('image', width, height, 1)
+        if marker[1] == 0xDA:
+            break
+        offset += 2 + struct.unpack('>H', marker[2:4])[0]
+    raise ProbeError("JPEG frame header not found")
+
+
+def check_limits(info, max_pixels=None, max_duration=None, max_frames=None):
+    """Return a rejection reason if the probed media is over budget, else None"""
+    if max_pixels and info.pixels and info.pixels > max_pixels:
+        return f"Media resolution {info.width}x{info.height} is too large"
+    if max_frames and info.frames and info.frames > max_frames:
+        return f"Media has too many frames ({info.frames})"
+    if max_duration and info.duration and info.duration > max_duration:
+        return f"Video is too long ({info.duration:.0f}s, limit {max_duration}s)"
+    return None
@@ -0,0 +1,195 @@
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, case, func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger('age-verify-bot')
+
+# Applied migrations, one row per version
+migrations_table = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def add_missing_columns(connection, metadata):
+    """Add the nullable columns introduced before migrations were versioned"""
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+def create_indexes(*names):
+    """Migration that creates the named model indexes on tables that predate them"""
+    def migrate(connection, metadata):
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in names:
+                    # IF NOT EXISTS rather than checkfirst, which cannot reflect expression indexes
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+    return migrate
+
+
+def drop_indexes(*names):
+    """Migration that drops indexes the models no longer declare"""
+    def migrate(connection, metadata):
+        for name in names:
+            connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    return migrate
+
+
+def enable_incremental_vacuum(engine, metadata):
+    """Switch auto_vacuum to INCREMENTAL, which an existing database only picks up through a VACUUM"""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            cursor.execute('VACUUM')
+        cursor.close()
+    finally:
+        connection.close()
+
+
+# VACUUM cannot run inside a transaction
+enable_incremental_vacuum.outside_transaction = True
+
+
+def backfill_daily_stats(connection, metadata):
+    """Rebuild the daily_stats rollup from the verifications table; returns the number of rows written"""
+    verifications = metadata.tables['verifications']
+    daily_stats = metadata.tables['daily_stats']
+    guild = func.coalesce(verifications.c.guild_id, '')
+    rows = {}
+
+    def row(guild_id, day):
+        key = (guild_id, date.fromisoformat(day))
+        return rows.setdefault(key, {
+            'guild_id': key[0], 'day': key[1], 'submissions': 0, 'approvals': 0,
+            'rejections': 0, 'processing_seconds': 0.0, 'processed': 0,
+        })
+
+    submitted = func.date(verifications.c.submission_date)
+    for guild_id, day, count in connection.execute(
+        select(guild, submitted, func.count()).where(
+            verifications.c.submission_date.isnot(None)
+        ).group_by(guild, submitted)
+    ):
+        row(guild_id, day)['submissions'] = count
+
+    # Reviews without a review date predate it being recorded and cannot be placed on a day
+    reviewed = func.date(verifications.c.review_date)
+    seconds = (func.julianday(verifications.c.review_date) - func.julianday(verifications.c.submission_date)) * 86400
+    for guild_id, day, approvals, rejections, total_seconds, processed in connection.execute(
+        select(
+            guild, reviewed,
+            func.sum(case((verifications.c.verified == True, 1), else_=0)),
+            func.sum(case((verifications.c.verified == True, 0), else_=1)),
+            func.sum(seconds),
+            func.count()
+        ).where(
+            verifications.c.reviewed == True,
+            verifications.c.review_date.isnot(None),
+            verifications.c.submission_date.isnot(None)
+        ).group_by(guild, reviewed)
+    ):
+        row(guild_id, day).update(
+            approvals=approvals, rejections=rejections, processing_seconds=total_seconds, processed=processed
+        )
+
+    connection.execute(daily_stats.delete())
+    if rows:
+        connection.execute(daily_stats.insert(), list(rows.values()))
+    return len(rows)
+
+
+def add_daily_stats(connection, metadata):
+    """Add verifications.guild_id and fill the daily_stats rollup that create_all made"""
+    add_missing_columns(connection, metadata)
+    backfill_daily_stats(connection, metadata)
+
+
+def per_guild_review_indexes(connection, metadata):
+    """Replace the review queue indexes with ones that lead with the guild"""
+    create_indexes(
+        'ix_verifications_reviewed_guild_submitted',
+        'ix_verifications_reviewed_guild_liveness',
+        'ix_verifications_reviewed_guild_age',
+    )(connection, metadata)
+    drop_indexes('ix_verifications_reviewed_liveness', 'ix_verifications_reviewed_age')(connection, metadata)
+
+
+# (version, name, function(connection, metadata)); append only, never renumber.
+# Each runs in its own write transaction and must also be safe on a database
+# that create_all just built with the current schema. Functions marked
+# outside_transaction get the engine instead and must be idempotent, since
+# two processes may both run them before one records the version.
+MIGRATIONS = [
+    (1, 'add columns from before versioning', add_missing_columns),
+    (2, 'indexes for review queue, user history, date ranges and job claims', create_indexes(
+        'ix_verifications_reviewed_submitted',
+        'ix_verifications_user_submitted',
+        'ix_verifications_submitted',
+        'ix_verifications_media_digest',
+        'ix_verification_jobs_status_available',
+        'ix_verification_jobs_user_status',
+    )),
+    # Superseded by the per-guild indexes of migration 7, so no longer creates anything
+    (3, 'indexes for the liveness and age review orders', create_indexes(
+        'ix_verifications_reviewed_liveness',
+        'ix_verifications_reviewed_age',
+    )),
+    (4, 'incremental auto-vacuum for the retention purge', enable_incremental_vacuum),
+    (5, 'daily statistics rollup', add_daily_stats),
+    (6, 'indexes for the age histogram and staff review windows', create_indexes(
+        'ix_verifications_verified_age',
+        'ix_verifications_review_date',
+    )),
+    (7, 'per-guild review queue indexes', per_guild_review_indexes),
+    (8, 'index for per-guild staff review statistics', create_indexes('ix_verifications_guild_review_date')),
+]
+
+
+def applied_version(connection):
+    """Highest applied migration version, 0 for a database without any"""
+    return connection.execute(select(migrations_table.c.version).order_by(
+        migrations_table.c.version.desc()
+    ).limit(1)).scalar() or 0
+
+
+def run_migrations(engine, metadata, migrations=MIGRATIONS):
+    """Apply pending migrations in order; returns the number applied
+
+    Each migration re-reads the applied version inside its own BEGIN IMMEDIATE
+    transaction, so bot processes starting together apply it only once.
+    """
+    migrations_table.create(engine, checkfirst=True)
+    applied = 0
+    for version, name, migrate in migrations:
+        outside_transaction = getattr(migrate, 'outside_transaction', False)
+        if outside_transaction:
+            with engine.connect() as connection:
+                if applied_version(connection) >= version:
+                    continue
+            migrate(engine, metadata)
+
+        with engine.connect() as connection:
+            connection.info['begin_mode'] = 'IMMEDIATE'
+            with connection.begin():
+                if applied_version(connection) >= version:
+                    continue
+                if not outside_transaction:
+                    migrate(connection, metadata)
+                connection.execute(migrations_table.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+            logger.info(f"Applied database migration {version}: {name}")
+            applied += 1
+    return applied
@@ -0,0 +1,382 @@
+import logging
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('age-verify-bot')
+
+# Leading bytes of the image formats accepted for verification
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',         # JPEG
+    b'\x89PNG\r\n\x1a\n',    # PNG
+    b'GIF87a', b'GIF89a',    # GIF
+)
+
+
+# Intermediate products the checks share, and what each one is computed from
+PRODUCT_DEPENDENCIES = {
+    'gray': (),
+    'image': (),
+    'rgb': ('image',),
+    'detections': ('rgb',),
+    'landmarks': ('detections',),
+}
+
+
+def product_closure(products):
+    """All products needed to compute the given ones"""
+    needed = set()
+    pending = list(products)
+    while pending:
+        product = pending.pop()
+        if product not in needed:
+            needed.add(product)
+            pending.extend(PRODUCT_DEPENDENCIES[product])
+    return needed
+
+
+class CheckContext:
+    """Intermediate products shared by the cascade checks, each computed only when first needed"""
+
+    def __init__(self, detector, image_data, gray_side=640):
+        self.detector = detector
+        self.image_data = image_data
+        self.gray_side = gray_side
+        self.product_ms = {}  # product name -> milliseconds spent computing it
+        self._products = {}
+
+    def _product(self, name, compute):
+        if name not in self._products:
+            computed_before = set(self.product_ms)
+            start = time.perf_counter()
+            self._products[name] = compute()
+            # Products computed along the way record their own time, so only count the remainder
+            nested = sum(ms for product, ms in self.product_ms.items() if product not in computed_before)
+            self.product_ms[name] = (time.perf_counter() - start) * 1000 - nested
+        return self._products[name]
+
+    @property
+    def gray(self):
+        """Small grayscale decode, enough for blur and exposure statistics"""
+        return self._product('gray', lambda: self.detector._decode_image(
+            self.image_data, self.gray_side, grayscale=True
+        ))
+
+    @property
+    def image(self):
+        """Bounded-size colour decode used by the models"""
+        return self._product('image', lambda: self.detector._decode_image(self.image_data))
+
+    @property
+    def rgb(self):
+        return self._product('rgb', lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
+
+    @property
+    def detections(self):
+        return self._product('detections', lambda: self.detector._detection_boxes(
+            self.detector.face_detection.process(self.rgb)
+        ))
+
+    @property
+    def landmarks(self):
+        return self._product('landmarks', lambda: self.detector._mesh_landmarks(
+            self.rgb, self.detections[0]
+        ) if self.detections else None)
+
+    def peek(self, name, default=None):
+        """A product if it has already been computed, without computing it"""
+        return self._products.get(name, default)
+
+
+class CascadeCheck:
+    """One step of the spoof cascade; run() returns a rejection reason or None"""
+
+    name = None
+    # Shared products the check reads from the context
+    requires = ()
+    # Rough cost in milliseconds of the check itself plus its products,
+    # used for ordering until real timings exist
+    expected_ms = 0.0
+
+    def run(self, context):
+        raise NotImplementedError
+
+
+class HeaderCheck(CascadeCheck):
+    name = 'header'
+    expected_ms = 0.01
+
+    def __init__(self, min_bytes=1024, max_bytes=25 * 1024 * 1024):
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+
+    def run(self, context):
+        data = context.image_data
+        if not isinstance(data, bytes):
+            return None
+        if len(data) < self.min_bytes:
+            return "File too small to be a usable photo"
+        if len(data) > self.max_bytes:
+            return "File too large"
+        if not data.startswith(IMAGE_SIGNATURES):
+            return "Unsupported or corrupted image file"
+        return None
+
+
+class BlurCheck(CascadeCheck):
+    name = 'blur'
+    requires = ('gray',)
+    expected_ms = 3.0
+
+    def __init__(self, threshold=100):
+        self.threshold = threshold
+
+    def run(self, context):
+        if context.gray is None:
+            return "Failed to load image"
+        if cv2.Laplacian(context.gray, cv2.CV_64F).var() < self.threshold:
+            return "Image too blurry - possible printed photo"
+        return None
+
+
+class ExposureCheck(CascadeCheck):
+    name = 'exposure'
+    requires = ('gray',)
+    expected_ms = 3.0
+
+    def __init__(self, min_brightness=40, max_brightness=215, max_clipped_fraction=0.25):
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped_fraction = max_clipped_fraction
+
+    def run(self, context):
+        gray = context.gray
+        if gray is None:
+            return "Failed to load image"
+        brightness = gray.mean()
+        if brightness < self.min_brightness:
+            return "Image too dark"
+        if brightness > self.max_brightness:
+            return "Image overexposed"
+        clipped = np.count_nonzero((gray <= 5) | (gray >= 250)) / gray.size
+        if clipped > self.max_clipped_fraction:
+            return "Image has too many over- or underexposed areas"
+        return None
+
+
+class FaceCountCheck(CascadeCheck):
+    name = 'face_count'
+    requires = ('detections',)
+    expected_ms = 20.0
+
+    def run(self, context):
+        if context.image is None:
+            return "Failed to load image"
+        if not context.detections:
+            return "No face detected"
+        if len(context.detections) > 1:
+            return "Multiple faces detected"
+        return None
+
+
+class MeshCheck(CascadeCheck):
+    name = 'mesh'
+    requires = ('landmarks',)
+    expected_ms = 40.0
+
+    def run(self, context):
+        if context.image is None:
+            return "Failed to load image"
+        if context.landmarks is None:
+            return "Cannot extract facial features"
+        return None
+
+
+class MoireCheck(CascadeCheck):
+    """Rejects screen and print replays by periodic peaks in the face crop's spectrum
+
+    Moiré from a re-photographed screen and the dots of a halftone print show
+    up as isolated spectral peaks far above the smooth radial falloff of a
+    natural image. Each frequency is compared with the mean power at its
+    radius. Frequencies next to the axes are left out, since JPEG block edges
+    put energy there. The default peak_ratio comes from the score distributions
+    of benchmarks/moire_calibration.py: natural faces stay under about 13, while
+    blurred halftone re-photographs with 4-5 px screens score from about 18.
+    """
+
+    name = 'moire'
+    requires = ('image', 'detections')
+    expected_ms = 25.0
+
+    def __init__(self, size=256, min_frequency=0.12, max_frequency=0.45, axis_width=2,
+                 peak_ratio=16.0, min_face_side=64):
+        self.size = size
+        self.peak_ratio = peak_ratio
+        self.min_face_side = min_face_side
+
+        # Radial bin and band mask of every rfft2 coefficient, built once per check
+        rows = np.fft.fftfreq(size)[:, None]
+        columns = np.fft.rfftfreq(size)[None, :]
+        radius = np.hypot(rows, columns)
+        self._bins = np.minimum((radius * size).astype(np.intp), size // 2).ravel()
+        off_axis = (np.abs(rows) * size > axis_width) & (columns * size > axis_width)
+        self._off_axis = off_axis.ravel()
+        self._band = (off_axis & (radius >= min_frequency) & (radius <= max_frequency)).ravel()
+        self._bin_counts = np.maximum(
+            np.bincount(self._bins, weights=self._off_axis, minlength=size // 2 + 1), 1
+        )
+        self._window = np.outer(np.hanning(size), np.hanning(size)).astype(np.float32)
+
+    def _face_patch(self, image, box):
+        """Grayscale face crop resampled to size x size, or None if the face is too small"""
+        height, width = image.shape[:2]
+        xmin, ymin, box_width, box_height = box[:4]
+        x0, y0 = max(int(xmin * width), 0), max(int(ymin * height), 0)
+        x1, y1 = min(int((xmin + box_width) * width), width), min(int((ymin + box_height) * height), height)
+        if min(x1 - x0, y1 - y0) < self.min_face_side:
+            return None
+        crop = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        interpolation = cv2.INTER_AREA if max(crop.shape) > self.size else cv2.INTER_LINEAR
+        return cv2.resize(crop, (self.size, self.size), interpolation=interpolation).astype(np.float32)
+
+    def score(self, patch):
+        """Largest ratio of a band frequency's power to the mean power at its radius"""
+        patch = (patch - patch.mean()) * self._window
+        power = np.square(np.abs(np.fft.rfft2(patch))).ravel()
+        profile = np.bincount(self._bins, weights=power * self._off_axis,
+                              minlength=len(self._bin_counts)) / self._bin_counts
+        ratios = power[self._band] / np.maximum(profile[self._bins[self._band]], 1e-12)
+        return float(ratios.max())
+
+    def run(self, context):
+        if context.image is None or not context.detections:
+            # Face count and decode failures are reported by their own checks
+            return None
+        patch = self._face_patch(context.image, context.detections[0])
+        if patch is None:
+            return None
+        if self.score(patch) > self.peak_ratio:
+            return "Screen or printed photo pattern detected"
+        return None
+
+
+CHECK_TYPES = {
+    check.name: check
+    for check in (HeaderCheck, BlurCheck, ExposureCheck, FaceCountCheck, MeshCheck, MoireCheck)
+}
+
+
+class CheckStats:
+    """Pass/fail counts and latency of one cascade check"""
+
+    def __init__(self):
+        self.passed = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.reasons = {}
+
+    @property
+    def runs(self):
+        return self.passed + self.rejected
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.runs if self.runs else 0.0
+
+    def record(self, passed, elapsed_ms, reason=None):
+        if passed:
+            self.passed += 1
+        else:
+            self.rejected += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        self.total_ms += elapsed_ms
+
+
+class CascadeStats:
+    """Per-check statistics, aggregated from cascade traces"""
+
+    def __init__(self):
+        self.checks = {}
+
+    def record(self, trace):
+        """Add a trace of (check name, reason or None, milliseconds) tuples"""
+        for name, reason, elapsed_ms in trace:
+            self.checks.setdefault(name, CheckStats()).record(reason is None, elapsed_ms, reason)
+
+
+class SpoofCascade:
+    """Runs spoof and quality checks cheapest first and stops at the first rejection
+
+    A check's cost is its own measured time plus the measured time of the
+    shared products it needs, so ordering does not depend on which check
+    happened to pay for a decode first.
+    """
+
+    def __init__(self, checks, adaptive=True):
+        self.checks = list(checks)
+        self.adaptive = adaptive
+        self.stats = CascadeStats()
+        self._own_ms = {}  # check name -> (total ms, runs), excluding product time
+        self._product_ms = {}  # product name -> (total ms, computations)
+
+    @classmethod
+    def from_config(cls, options=None):
+        """Build the cascade from the spoof_cascade config section"""
+        options = dict(options or {})
+        names = options.pop('checks', list(CHECK_TYPES))
+        adaptive = options.pop('adaptive_order', True)
+        check_options = options.pop('check_options', {})
+        checks = [CHECK_TYPES[name](**check_options.get(name, {})) for name in names]
+        return cls(checks, adaptive)
+
+    @staticmethod
+    def _mean(totals, name):
+        total, count = totals.get(name, (0.0, 0))
+        return total / count if count else None
+
+    @staticmethod
+    def _add(totals, name, elapsed_ms):
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + elapsed_ms, count + 1)
+
+    def _cost(self, check):
+        own = self._mean(self._own_ms, check.name)
+        if not self.adaptive or own is None:
+            return check.expected_ms
+        products = [self._mean(self._product_ms, p) for p in product_closure(check.requires)]
+        if any(cost is None for cost in products):
+            return check.expected_ms
+        return own + sum(products)
+
+    def ordered_checks(self):
+        """Checks sorted by measured (or expected) cost"""
+        return sorted(self.checks, key=self._cost)
+
+    def run(self, context):
+        """Run the checks; returns (rejection reason or None, trace)"""
+        trace = []
+        for check in self.ordered_checks():
+            products_before = dict(context.product_ms)
+            start = time.perf_counter()
+            try:
+                reason = check.run(context)
+            except Exception as e:
+                logger.error(f"Error in {check.name} check: {e}")
+                reason = f"Error in spoof detection: {str(e)}"
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            trace.append((check.name, reason, elapsed_ms))
+
+            # Split the elapsed time into the check itself and the products it computed
+            new_products = {
+                name: ms for name, ms in context.product_ms.items() if name not in products_before
+            }
+            for name, ms in new_products.items():
+                self._add(self._product_ms, name, ms)
+            self._add(self._own_ms, check.name, elapsed_ms - sum(new_products.values()))
+
+            if reason is not None:
+                break
+
+        self.stats.record(trace)
+        return trace[-1][1] if trace else None, trace